@@ -0,0 +1,117 @@
+import re
+from typing import Any, Callable, Optional
+from urllib.parse import urljoin
+
+ARCHIVE_TYPES = ("links", "sitemap", "template")
+
+# Sitemap elements live in this namespace; lxml needs it spelled out
+SITEMAP_NS = "{http://www.sitemaps.org/schemas/sitemap/0.9}"
+
+def templatePages(archive: dict[str, Any]) -> list[str]:
+    """URLs from a template such as "https://example.com/comic/{n}" or ".../{n:04d}.html" and a page range."""
+    start = int(archive.get('start', 1))
+    end = int(archive['end'])
+    step = int(archive.get('step') or 1)
+    return [archive['url'].format(n=n) for n in range(start, end + 1, step)]
+
+def linkPages(archive: dict[str, Any], downloader: Any, resolveSelector: Callable[[list], tuple]) -> list[str]:
+    """Every link matched by `selector` on the archive page, following `next_selector` for paginated archives."""
+    selector = resolveSelector(archive['selector'])
+    nextSelector = resolveSelector(archive['next_selector']) if archive.get('next_selector') else None
+
+    pages: list[str] = []
+    seen: set[str] = set()
+    visited: set[str] = set()
+    url: Optional[str] = archive['url']
+    while url and url not in visited:
+        visited.add(url)
+        downloader.load(url)
+        for link in downloader.getLinks(selector):
+            if link not in seen:
+                seen.add(link)
+                pages.append(link)
+        url = downloader.getLink(nextSelector) if nextSelector else None
+    return pages
+
+def sitemapPages(archive: dict[str, Any], fetch: Callable[[str], bytes]) -> list[str]:
+    """<loc> entries of a sitemap, descending into sitemap indexes, optionally filtered by a `pattern` regex."""
+    from lxml import etree
+
+    pattern = re.compile(archive['pattern']) if archive.get('pattern') else None
+    pages: list[str] = []
+    seen: set[str] = set()
+    pending = [archive['url']]
+    visited: set[str] = set()
+    while pending:
+        url = pending.pop(0)
+        if url in visited:
+            continue
+        visited.add(url)
+
+        root = etree.fromstring(fetch(url), parser=etree.XMLParser(resolve_entities=False, no_network=True, recover=True))
+        if root is None:
+            continue
+        for loc in root.iter(f"{SITEMAP_NS}loc", "loc"):
+            location = urljoin(url, (loc.text or "").strip())
+            if not location:
+                continue
+            parent = loc.getparent()
+            if parent is not None and parent.tag in (f"{SITEMAP_NS}sitemap", "sitemap"):
+                pending.append(location)
+            elif location not in seen and (pattern is None or pattern.search(location)):
+                seen.add(location)
+                pages.append(location)
+    return pages
+
+def discoverPages(archive: dict[str, Any], resolveSelector: Callable[[list], tuple], userAgent: Optional[str] = None) -> list[str]:
+    """List every page of a comic from its `archive` setting, in reading order.
+
+    Archive and sitemap pages are fetched without a browser, so their listing
+    has to be in the static HTML. `reverse` flips listings that put the newest
+    page first.
+    """
+    kind = archive.get('type')
+    if kind == "template":
+        pages = templatePages(archive)
+    else:
+        from httpdownloader import DEFAULT_USER_AGENT, HttpComicDownloader
+        with HttpComicDownloader(userAgent or DEFAULT_USER_AGENT) as downloader:
+            if kind == "links":
+                pages = linkPages(archive, downloader, resolveSelector)
+            elif kind == "sitemap":
+                def fetch(url: str) -> bytes:
+                    response = downloader.session.get(url, timeout=downloader.timeout)
+                    response.raise_for_status()
+                    return response.content
+                pages = sitemapPages(archive, fetch)
+            else:
+                raise ValueError(f"Unknown archive type '{kind}', expected one of {', '.join(ARCHIVE_TYPES)}")
+
+    if archive.get('reverse') == True:
+        pages.reverse()
+    return pages
+
+def validateArchive(archive: Any) -> list[str]:
+    """Problems with an `archive` setting; empty when it is usable (or not set)."""
+    if archive is None:
+        return []
+    if not isinstance(archive, dict):
+        return ["archive must be an object"]
+
+    kind = archive.get('type')
+    if kind not in ARCHIVE_TYPES:
+        return [f"archive type '{kind}' is not one of {', '.join(ARCHIVE_TYPES)}"]
+
+    problems: list[str] = []
+    if not archive.get('url'):
+        problems.append("archive is missing url")
+    if kind == "links":
+        selector = archive.get('selector')
+        if not isinstance(selector, list) or len(selector) != 2:
+            problems.append("archive selector must be [type, selector]")
+    elif kind == "template":
+        if "{n" not in (archive.get('url') or ""):
+            problems.append("archive url must contain {n}")
+        if not isinstance(archive.get('end'), int):
+            problems.append("archive end must be a number")
+    return problems
@@ -0,0 +1,417 @@
+import os
+import gc
+import sys
+import json
+import time
+import base64
+import shutil
+import argparse
+import resource
+import tempfile
+import threading
+import subprocess
+import contextlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Optional
+
+# Smallest valid PNG; served inline as a data: URI and used as the head of generated images
+PNG_1X1 = base64.b64decode(
+    "iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="
+)
+
+class MockComicSite:
+    """Synthetic Comic Easel style webcomic served from localhost.
+
+    Every comic has `pages` pages at /<comic>/<n>. Each page has a cc-newsheader
+    title, `imagesPerPage` cc-comic images with small/large srcset variants
+    (every `dataURIEvery`-th page inlines its image as a data: URI instead), and
+    a cc-next link on all but the last page. /<comic>/archive links every page
+    and /sitemap.xml lists them all, for archive backfills. Every response is
+    delayed by `latency` seconds.
+    """
+
+    def __init__(self,
+        pages: int = 100,
+        comics: int = 1,
+        imagesPerPage: int = 1,
+        imageSize: int = 200 * 1024,
+        latency: float = 0.0,
+        dataURIEvery: int = 10,
+        ) -> None:
+        self.pages = pages
+        self.comics = comics
+        self.imagesPerPage = imagesPerPage
+        self.imageSize = imageSize
+        self.latency = latency
+        self.dataURIEvery = dataURIEvery
+        self.requests: int = 0
+        self.bytesServed: int = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'MockComicSite':
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.stop()
+        # Do not suppress exceptions
+        return False
+
+    @property
+    def baseURL(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def comicURL(self, comic: int) -> str:
+        return f"{self.baseURL}/comic{comic}/1"
+
+    def start(self) -> None:
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Send headers and body in one write; split writes stall on delayed ACKs
+            wbufsize = 64 * 1024
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if site.latency:
+                    time.sleep(site.latency)
+                status, contentType, body = site.respond(self.path)
+                self.send_response(status)
+                self.send_header("Content-Type", contentType)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with site._lock:
+                    site.requests += 1
+                    site.bytesServed += len(body)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-comic-site", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def respond(self, path: str) -> tuple[int, str, bytes]:
+        parts = path.split('?')[0].strip('/').split('/')
+        try:
+            if parts == ["sitemap.xml"]:
+                return 200, "application/xml", self.sitemap()
+            if len(parts) == 2 and parts[0].startswith("comic") and parts[1] == "archive":
+                return 200, "text/html; charset=utf-8", self.archive(parts[0])
+            if len(parts) == 2 and parts[0].startswith("comic"):
+                return 200, "text/html; charset=utf-8", self.page(parts[0], int(parts[1]))
+            if len(parts) == 3 and parts[0] == "images":
+                return 200, "image/png", self.image(parts[2])
+        except ValueError:
+            pass
+        return 404, "text/plain", b"Not Found"
+
+    def page(self, comic: str, number: int) -> bytes:
+        if not 1 <= number <= self.pages:
+            raise ValueError(number)
+
+        images = []
+        for index in range(1, self.imagesPerPage + 1):
+            if self.dataURIEvery and number % self.dataURIEvery == 0:
+                src = "data:image/png;base64," + base64.b64encode(PNG_1X1).decode()
+                images.append(f'<img class="cc-comic" src="{src}" width="1">')
+            else:
+                small = f"/images/{comic}/{number}-{index}-small.png"
+                large = f"/images/{comic}/{number}-{index}-large.png"
+                images.append(
+                    f'<img class="cc-comic" src="{small}" srcset="{small} 400w, {large} 1600w" width="400">'
+                )
+
+        nextLink = f'<a class="cc-next" href="/{comic}/{number + 1}">Next</a>' if number < self.pages else ''
+        return f"""<!DOCTYPE html>
+<html>
+<head><title>{comic} page {number}</title></head>
+<body>
+<h2 class="cc-newsheader">Page {number}</h2>
+<div id="comic">{''.join(images)}</div>
+<nav>{nextLink}</nav>
+</body>
+</html>""".encode()
+
+    def archive(self, comic: str) -> bytes:
+        links = "\n".join(f'<li><a class="archive-link" href="/{comic}/{n}">Page {n}</a></li>' for n in range(1, self.pages + 1))
+        return f"<!DOCTYPE html>\n<html><body><ul>{links}</ul></body></html>".encode()
+
+    def sitemap(self) -> bytes:
+        urls = "".join(
+            f"<url><loc>{self.baseURL}/comic{comic}/{n}</loc></url>"
+            for comic in range(1, self.comics + 1) for n in range(1, self.pages + 1)
+        )
+        return f'<?xml version="1.0" encoding="UTF-8"?><urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>'.encode()
+
+    def image(self, name: str) -> bytes:
+        # Unique per image so deduplication does not flatter the numbers
+        size = self.imageSize if name.endswith("-large.png") else max(len(PNG_1X1), self.imageSize // 16)
+        seed = name.encode()
+        body = PNG_1X1 + seed
+        return body + b'\0' * max(0, size - len(body))
+
+def peakRSS() -> int:
+    """Peak resident set size of this process in bytes."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    return usage.ru_maxrss if sys.platform == "darwin" else usage.ru_maxrss * 1024
+
+class TreeRSSSampler:
+    """Samples the RSS of this process and its children (geckodriver, Firefox) in the background."""
+
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.peak: int = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> 'TreeRSSSampler':
+        self._thread = threading.Thread(target=self._run, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        # Do not suppress exceptions
+        return False
+
+    def _run(self) -> None:
+        from memory import processTreeRSS
+        while True:
+            self.peak = max(self.peak, processTreeRSS(os.getpid()) or 0)
+            if self._stop.wait(self.interval):
+                return
+
+def archiveSource(kind: Optional[str], site: MockComicSite, comic: int) -> Optional[dict[str, Any]]:
+    """The `archive` setting that backfills `comic` from the mock site, or None to walk next links."""
+    if kind == "links":
+        return {"type": "links", "url": f"{site.baseURL}/comic{comic}/archive", "selector": ["class_name", "archive-link"]}
+    if kind == "sitemap":
+        return {"type": "sitemap", "url": f"{site.baseURL}/sitemap.xml", "pattern": f"/comic{comic}/\\d+$"}
+    if kind == "template":
+        return {"type": "template", "url": f"{site.baseURL}/comic{comic}/{{n}}", "start": 1, "end": site.pages}
+    return None
+
+def phaseTotals(metrics) -> dict[str, dict[str, float]]:
+    """Seconds and calls per phase, summed over every comic."""
+    totals: dict[str, dict[str, float]] = {}
+    for data in metrics.snapshot()["comics"].values():
+        for phase, summary in data["phases"].items():
+            total = totals.setdefault(phase, {"seconds": 0.0, "calls": 0})
+            total["seconds"] = round(total["seconds"] + summary["sum"], 4)
+            total["calls"] += summary["count"]
+    return dict(sorted(totals.items()))
+
+def gitCommit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def createApplication(args: argparse.Namespace, site: MockComicSite) -> Any:
+    """An Application crawling every comic of `site`, configured in the current directory."""
+    # Imported here so the repository root does not need to be the working directory
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    from config import Config
+    from main import Application
+
+    config = Config("config.json")
+    config.set('comics', [{
+        "enabled": True,
+        "name": f"Benchmark {comic}",
+        "url": site.comicURL(comic),
+        "page_num": 1,
+        "engine": args.engine,
+        "ready_timeout": 10,
+        "image_selector": ["class_name", "cc-comic"],
+        "title_selector": ["class_name", "cc-newsheader"],
+        "next_selector": ["class_name", "cc-next"],
+        "archive": archiveSource(args.archive, site, comic),
+    } for comic in range(1, args.comics + 1)])
+    config.set('max_workers', args.max_workers)
+    config.set('max_per_host', args.max_workers)
+    config.set('download_workers', args.download_workers)
+    config.set('archive_workers', args.archive_workers)
+    # Measure the crawl itself, not the politeness defaults
+    config.set('rate_initial', 1000.0)
+    config.set('rate_max', 1000.0)
+    return Application(config)
+
+def parameters(args: argparse.Namespace) -> dict[str, Any]:
+    return {
+        "engine": args.engine,
+        "pages": args.pages,
+        "comics": args.comics,
+        "images_per_page": args.images_per_page,
+        "image_size": args.image_size,
+        "latency_ms": args.latency,
+        "max_workers": args.max_workers,
+        "download_workers": args.download_workers,
+        "archive": args.archive,
+        "archive_workers": args.archive_workers,
+    }
+
+def runBenchmark(args: argparse.Namespace) -> dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="comic-benchmark-")
+    previous = os.getcwd()
+
+    try:
+        with MockComicSite(args.pages, args.comics, args.images_per_page, args.image_size, args.latency / 1000, args.data_uri_every) as site:
+            os.chdir(workdir)
+            os.mkdir("comics")
+
+            app = createApplication(args, site)
+            output = sys.stdout if args.verbose else open(os.devnull, 'w')
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(output), TreeRSSSampler() as sampler:
+                app.downloadComics()
+            elapsed = time.perf_counter() - start
+            if output is not sys.stdout:
+                output.close()
+
+            images = 0
+            bytesWritten = 0
+            for root, _, files in os.walk("comics"):
+                for name in files:
+                    if not name.startswith('.') and root != "comics" and ".cache" not in root:
+                        images += 1
+                        bytesWritten += os.path.getsize(os.path.join(root, name))
+
+            # Pages actually crawled; a comic that failed partway must not count in full
+            pages = sum(data["counters"].get("pages", 0) for data in app.metrics.snapshot()["comics"].values())
+            return {
+                "commit": gitCommit(),
+                "parameters": parameters(args),
+                "results": {
+                    "seconds": round(elapsed, 4),
+                    "pages": pages,
+                    "pages_expected": args.pages * args.comics,
+                    "images": images,
+                    "bytes": bytesWritten,
+                    "pages_per_second": round(pages / elapsed, 3),
+                    "images_per_second": round(images / elapsed, 3),
+                    "bytes_per_second": round(bytesWritten / elapsed, 1),
+                    "requests": site.requests,
+                    "peak_rss_bytes": peakRSS(),
+                    "peak_tree_rss_bytes": sampler.peak,
+                    "failures": app.failures,
+                },
+                "phases": phaseTotals(app.metrics),
+                "comics": app.metrics.snapshot()["comics"],
+            }
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+def runSoak(args: argparse.Namespace) -> dict[str, Any]:
+    """Crawl the mock site from scratch over and over for `args.soak` seconds and check memory stays flat.
+
+    One Application serves every round, like a crawler that never exits. After
+    `args.soak_warmup` rounds, the median memory of the next `args.soak_window`
+    rounds is the baseline; the median of the last `args.soak_window` rounds
+    may exceed it by at most `args.max_growth` MB, for this process and for
+    this process plus its browsers at their peak.
+    """
+    from memory import processRSS
+
+    workdir = tempfile.mkdtemp(prefix="comic-soak-")
+    previous = os.getcwd()
+    minimumRounds = args.soak_warmup + 2 * args.soak_window
+
+    try:
+        with MockComicSite(args.pages, args.comics, args.images_per_page, args.image_size, args.latency / 1000, args.data_uri_every) as site:
+            os.chdir(workdir)
+            app = createApplication(args, site)
+            output = sys.stdout if args.verbose else open(os.devnull, 'w')
+
+            rounds: list[dict[str, Any]] = []
+            deadline = time.monotonic() + args.soak
+            while time.monotonic() < deadline or len(rounds) < minimumRounds:
+                shutil.rmtree("comics", ignore_errors=True)
+                os.mkdir("comics")
+                start = time.perf_counter()
+                with contextlib.redirect_stdout(output), TreeRSSSampler() as sampler:
+                    app.downloadComics()
+                gc.collect()
+                rounds.append({
+                    "round": len(rounds) + 1,
+                    "seconds": round(time.perf_counter() - start, 3),
+                    "rss_bytes": processRSS(os.getpid()) or 0,
+                    "peak_tree_rss_bytes": sampler.peak,
+                    "failures": len(app.failures),
+                    "memory_restarts": app.metrics.snapshot().get("memory", {}).get("restarts", 0),
+                })
+                print(f"round {len(rounds)}: {rounds[-1]['rss_bytes'] / (1024 * 1024):.1f} MB, "
+                    f"peak with browsers {sampler.peak / (1024 * 1024):.1f} MB", file=sys.stderr)
+            if output is not sys.stdout:
+                output.close()
+
+        def median(key: str, selected: list[dict[str, Any]]) -> int:
+            return sorted(item[key] for item in selected)[len(selected) // 2]
+
+        baseline = rounds[args.soak_warmup:args.soak_warmup + args.soak_window]
+        final = rounds[-args.soak_window:]
+        growth = {key: median(key, final) - median(key, baseline) for key in ("rss_bytes", "peak_tree_rss_bytes")}
+        return {
+            "commit": gitCommit(),
+            "parameters": {**parameters(args), "soak_seconds": args.soak, "max_growth_mb": args.max_growth},
+            "results": {
+                "rounds": len(rounds),
+                "growth_bytes": growth,
+                "flat": all(value <= args.max_growth * 1024 * 1024 for value in growth.values()),
+                "failures": sum(item["failures"] for item in rounds),
+            },
+            "rounds": rounds,
+        }
+    finally:
+        os.chdir(previous)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Crawl a local synthetic webcomic and report throughput as JSON. Runs fully offline.")
+    parser.add_argument("--engine", default="http", choices=["http", "selenium"])
+    parser.add_argument("--pages", type=int, default=100, help="pages per comic")
+    parser.add_argument("--comics", type=int, default=1)
+    parser.add_argument("--images-per-page", type=int, default=1)
+    parser.add_argument("--image-size", type=int, default=200 * 1024, help="bytes per full-size image")
+    parser.add_argument("--latency", type=float, default=0, help="milliseconds added to every response")
+    parser.add_argument("--data-uri-every", type=int, default=10, help="inline a data: URI image on every Nth page (0 for never)")
+    parser.add_argument("--max-workers", type=int, default=1)
+    parser.add_argument("--download-workers", type=int, default=4)
+    parser.add_argument("--archive", choices=["links", "sitemap", "template"], help="backfill from an archive listing instead of walking next links")
+    parser.add_argument("--archive-workers", type=int, default=4)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--verbose", action="store_true", help="show the crawler's own output")
+    parser.add_argument("--soak", type=float, help="soak test: re-crawl for this many seconds and fail unless memory stays flat")
+    parser.add_argument("--soak-warmup", type=int, default=2, help="rounds ignored before the soak baseline")
+    parser.add_argument("--soak-window", type=int, default=3, help="rounds whose median is compared at each end of the soak")
+    parser.add_argument("--max-growth", type=float, default=16, help="MB of growth the soak test tolerates")
+    args = parser.parse_args()
+
+    result = runSoak(args) if args.soak is not None else runBenchmark(args)
+    report = json.dumps(result, indent=4)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(report + "\n")
+    else:
+        print(report)
+    if args.soak is not None and not result["results"]["flat"]:
+        exit(1)
@@ -0,0 +1,77 @@
+import os
+import json
+from typing import Any, NamedTuple
+from urllib.parse import quote, urlsplit
+
+class BrowserProfile(NamedTuple):
+    """Which resources the headless browser may fetch. Hashable so pooled browsers can be matched."""
+    blockImages: bool = True
+    blockFonts: bool = True
+    blockMedia: bool = True
+    blockTrackers: bool = True
+    allowedDomains: tuple[str, ...] = () # when set, every other host is blocked
+
+def _environmentProxy() -> str:
+    """PAC result for the proxy set in the environment, which a PAC script would otherwise bypass."""
+    for name in ("https_proxy", "HTTPS_PROXY", "http_proxy", "HTTP_PROXY"):
+        proxy = urlsplit(os.environ.get(name) or "")
+        if proxy.hostname:
+            return f"PROXY {proxy.hostname}:{proxy.port or 8080}"
+    return "DIRECT"
+
+def _pacScript(profile: BrowserProfile) -> str:
+    # Requests for hosts that are not allowed are sent to a closed local port and fail immediately
+    return """
+function FindProxyForURL(url, host) {
+    var allowed = %s;
+    for (var i = 0; i < allowed.length; i++) {
+        if (host === allowed[i] || dnsDomainIs(host, "." + allowed[i])) {
+            return %s;
+        }
+    }
+    return "PROXY 127.0.0.1:9";
+}
+""" % (
+        json.dumps(list(profile.allowedDomains)),
+        json.dumps(_environmentProxy()),
+    )
+
+def profilePreferences(profile: BrowserProfile) -> dict[str, Any]:
+    """Firefox preferences that implement `profile`.
+
+    Comic images are downloaded by our own HTTP client, so the browser only
+    needs the DOM; everything else it fetches is wasted time and memory.
+    """
+    preferences: dict[str, Any] = {
+        # Never speculatively fetch what the page merely links to
+        "network.prefetch-next": False,
+        "network.dns.disablePrefetch": True,
+        "network.http.speculative-parallel-limit": 0,
+    }
+
+    if profile.blockImages:
+        # Attributes such as src and srcset are still readable, nothing is fetched or decoded
+        preferences["permissions.default.image"] = 2
+
+    if profile.blockFonts:
+        preferences["gfx.downloadable_fonts.enabled"] = False
+        preferences["browser.display.use_document_fonts"] = 0
+
+    if profile.blockMedia:
+        preferences["media.autoplay.default"] = 5
+        preferences["media.preload.default"] = 0
+        preferences["media.preload.auto"] = 0
+        preferences["media.peerconnection.enabled"] = False
+
+    if profile.blockTrackers:
+        preferences["privacy.trackingprotection.enabled"] = True
+        preferences["privacy.trackingprotection.socialtracking.enabled"] = True
+        preferences["privacy.trackingprotection.cryptomining.enabled"] = True
+        preferences["privacy.trackingprotection.fingerprinting.enabled"] = True
+
+    if profile.allowedDomains:
+        # A PAC script replaces the system proxy settings, so it is only used when asked for
+        preferences["network.proxy.type"] = 2
+        preferences["network.proxy.autoconfig_url"] = "data:text/javascript," + quote(_pacScript(profile))
+
+    return preferences
@@ -1,21 +1,76 @@
-from typing import Any
+from typing import Any, Iterator
 import os
 import json
 import copy
+import time
+import atexit
+import tempfile
+import threading
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # Windows; config.json is then only safe to share between threads of one process
+    fcntl = None
 
 class Config:
+    # Progress updates are written in batches: after this many changes or this many seconds, and on flush()
+    FLUSH_CHANGES = 25
+    FLUSH_INTERVAL = 5.0
+
     DEFAULT_CONFIG = {
         "browser": "firefox",
+        "page_load_strategy": "normal", # normal, eager, none; how long the browser blocks on navigation
+        "block_images": True, # the browser never fetches images; they are downloaded separately
+        "block_fonts": True,
+        "block_media": True, # audio, video and WebRTC
+        "block_trackers": True, # Firefox tracking protection
         "delay": 0.25,
         "fallback_extension": "png",
         "download_by": "order", # order, name_desc, name_asc
         "overwrite_existing": False,
-        "update_config": False, # this will re-order if download_by is anything other than 'order'
+        "crawl_state": True, # keep an index in comics/<name>/ to skip saved pages and resume from the last one
+        "update_config": False, # write each comic's url and page_num back as it progresses
+        "max_workers": 1, # number of comics crawled in parallel, each with its own browser
+        "max_per_host": 1, # number of comics from the same host crawled at once
+        "driver_spares": 1, # idle browsers kept warm so a new comic or recycle does not wait for a cold start
+        "driver_max_pages": 0, # recycle a browser after this many pages (0 to leave it to the memory budgets)
+        "driver_max_rss_mb": 1536, # recycle a browser once geckodriver and Firefox use more memory than this (0 to disable)
+        "memory_budget_mb": 2048, # recycle every browser once this process and all its browsers use more than this together (0 to disable)
+        "memory_check_interval": 10, # seconds between checks against memory_budget_mb, and per browser against driver_max_rss_mb
+        "rate_initial": 2.0, # requests per second per host to start with; adapts to how the host responds
+        "rate_min": 0.2,
+        "rate_max": 10.0,
+        "retry_attempts": 5, # per page or image, for timeouts, connection errors, 429 and 5xx
+        "retry_backoff": 1.0, # seconds before the first retry, doubling on each attempt
+        "retry_backoff_max": 60.0,
+        "http_cache": True, # remember ETag/Last-Modified (and HTTP-engine pages) in comics/.cache for conditional requests
+        "http_cache_max_mb": 256, # page bodies and the validator index together; least recently used entries go first
+        "dedupe": "off", # off, comic, global; identical images are linked to the first copy instead of saved again
+        "dedupe_link": "hardlink", # hardlink, reflink (copy-on-write, btrfs/XFS only)
+        "download_workers": 4, # image downloads running alongside page navigation, per comic
+        "download_queue_size": 16, # images queued before the page walker has to wait
+        "archive_workers": 4, # pages loaded at once when a comic is backfilled from its archive
+        "metrics_file": "", # per-phase timings and counters; .ndjson appends a line per comic, anything else is one JSON document
+        "metrics_port": 0, # serve Prometheus-style metrics on 127.0.0.1:<port>/metrics while running (0 to disable)
+        "queue_lease_seconds": 60, # coordinate/worker mode: a task whose worker stops heartbeating is handed out again after this
+        "queue_max_attempts": 3, # times a task may be handed out again before it is marked failed
+        "pack": "off", # off, count, chapter; move finished pages into comics/<name>/*.cbz after each run (needs crawl_state)
+        "pack_pages": 100, # pages per archive when packing by count
+        "pack_keep_files": False, # keep the loose images after packing them
         "comics": [{
             "enabled": True,
             "name": "Comic Name",
             "url": "COMIC_PAGE_1_URL",
             "page_num": 1,
+            "engine": "selenium", # selenium, http (static sites only, no JavaScript)
+            "ready_timeout": 10, # seconds to wait for the image to get a real src; 0 falls back to the global delay
+            "scroll_to_bottom": False, # for sites that lazy-load images on scroll
+            "blank_first": False, # visit about:blank between pages
+            "allowed_domains": [], # if set, the browser may only contact these domains (and the comic's own)
+            "archive": None, # list every page up front and load them in parallel: {"type": "links", "url": ..., "selector": [...]}, {"type": "sitemap", "url": ..., "pattern": ...} or {"type": "template", "url": ".../{n}", "start": 1, "end": ...}
+            "chapter_pattern": None, # packing by chapter: a regex on the page title; its first group (or the whole match) names the chapter
             "image_selector": ["id", "cc-comic"],
             "title_selector": ["class_name", "cc-newsheader"],
             "next_selector": ["class_name", "cc-next"]
@@ -24,6 +79,13 @@ class Config:
 
     def __init__(self, fileName: str) -> None:
         self._fileName = fileName
+        # Shared between crawl workers; guards the store and writes to disk
+        self._lock = threading.RLock()
+        self._changes: int = 0
+        self._lastWrite = time.monotonic()
+        self._comicIndex: dict[str, int] = {}
+        # Progress not yet written, by comic name; merged into the file as it is on disk
+        self._pendingComics: dict[str, dict[str, Any]] = {}
         self._store = self._readConfig()
         self._ensureDefaultsExist()
         # Validate certain config values
@@ -33,6 +95,8 @@ class Config:
             print(f"Warning: Invalid download_by '{current_download_by}'. Falling back to 'order'.")
             self._store["download_by"] = "order"
             self._writeConfig()
+        # Changes still waiting for a batch are written when the interpreter exits
+        atexit.register(self.flush)
 
     def _ensureDefaultsExist(self, config: dict | None = None, default: dict | None = None) -> bool:
         # If config and default are None, start with the initial configuration
@@ -65,17 +129,70 @@ class Config:
 
         return writeConfig
 
-    def _writeConfig(self) -> None:
+    def _writeConfig(self, store: dict | None = None) -> None:
+        # Written to a temporary file and renamed over the original, so a crash never leaves it truncated
+        if store is None:
+            store = self._store
+            self._pendingComics.clear()
+        temp = None
         try:
             directory = os.path.dirname(self._fileName)
             if directory:
                 os.makedirs(directory, exist_ok=True)
-            with open(self._fileName, mode="w") as file:
-                json.dump(self._store, file, indent=4)
+            fd, temp = tempfile.mkstemp(prefix=f".{os.path.basename(self._fileName)}.", suffix=".tmp", dir=directory or ".")
+            with os.fdopen(fd, mode="w") as file:
+                json.dump(store, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            if os.path.exists(self._fileName):
+                os.chmod(temp, os.stat(self._fileName).st_mode & 0o777)
+            os.replace(temp, self._fileName)
+            temp = None
+            self._changes = 0
+            self._lastWrite = time.monotonic()
         except FileNotFoundError as e:
             raise FileNotFoundError(f"Could not write configuration: {e}")
         except IOError as e:
             raise IOError(f"An I/O error occurred while writing configuration: {e}")
+        finally:
+            if temp is not None and os.path.exists(temp):
+                os.remove(temp)
+
+    @contextmanager
+    def _fileLock(self) -> Iterator[None]:
+        """Serialise read-modify-write of the file with other processes, e.g. workers sharing a directory."""
+        if fcntl is None:
+            yield
+            return
+        directory, name = os.path.split(self._fileName)
+        with open(os.path.join(directory, f".{name}.lock"), 'a') as lock:
+            fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _writeProgress(self) -> None:
+        """Write batched comic progress into config.json as it is on disk now.
+
+        Other processes sharing the file write their own comics' progress, so
+        only the comics changed here are taken from memory.
+        """
+        with self._fileLock():
+            try:
+                with open(self._fileName, mode="r") as file:
+                    store = json.load(file)
+            except (FileNotFoundError, json.JSONDecodeError):
+                store = None
+
+            if isinstance(store, dict) and isinstance(store.get('comics'), list):
+                for comic in store['comics']:
+                    if isinstance(comic, dict) and comic.get('name') in self._pendingComics:
+                        comic.update(self._pendingComics[comic.get('name')])
+                self._writeConfig(store)
+            else:
+                self._writeConfig()
+            self._pendingComics.clear()
 
     def _readConfig(self) -> dict:
         try:
@@ -92,14 +209,54 @@ class Config:
         except IOError as e:
             raise IOError(f"An I/O error occurred while reading configuration: {e}")
 
+    @property
+    def lock(self) -> threading.RLock:
+        return self._lock
+
     def get(self, key: str) -> Any:
-        return self._store.get(key)
+        with self._lock:
+            return self._store.get(key)
 
     def set(self, key: str, value: Any) -> None:
-        self._store[key] = value
+        with self._lock:
+            self._store[key] = value
 
     def save(self) -> None:
-        self._writeConfig()
+        with self._lock:
+            self._writeConfig()
+
+    def flush(self) -> None:
+        """Write batched changes now, if there are any."""
+        with self._lock:
+            if self._changes:
+                self._writeProgress()
+
+    def updateComic(self, name: str, **fields: Any) -> bool:
+        """Change fields of one comic in place and schedule a batched write.
+
+        Used for crawl progress, which changes after every page; the comics list
+        is neither copied nor reordered. False if no comic has that name.
+        """
+        with self._lock:
+            comics = self._store.get('comics') or []
+            index = self._comicIndex.get(name)
+            if index is None or index >= len(comics) or comics[index].get('name') != name:
+                # The list was replaced or reordered since the index was built
+                self._comicIndex = {comic.get('name'): i for i, comic in enumerate(comics) if isinstance(comic, dict)}
+                index = self._comicIndex.get(name)
+                if index is None:
+                    return False
+
+            comic = comics[index]
+            if all(comic.get(key) == value for key, value in fields.items()):
+                return True
+            comic.update(fields)
+            self._pendingComics.setdefault(name, {}).update(fields)
+            self._changes += 1
+            if self._changes >= self.FLUSH_CHANGES or time.monotonic() - self._lastWrite >= self.FLUSH_INTERVAL:
+                self._writeProgress()
+            return True
 
     def pop(self, key: str, default: Any | None = None) -> Any:
-        return self._store.pop(key, default)
+        with self._lock:
+            return self._store.pop(key, default)
@@ -0,0 +1,189 @@
+import os
+import time
+import hashlib
+import sqlite3
+import threading
+from typing import Optional
+
+# ioctl request that asks the filesystem (btrfs, XFS, ...) to share extents between two files
+FICLONE = 0x40049409
+
+def reflink(source: str, destination: str) -> None:
+    """Create `destination` as a copy-on-write clone of `source`. Raises OSError where unsupported."""
+    try:
+        import fcntl
+    except ImportError:
+        raise OSError("reflinks are not supported on this platform")
+
+    with open(source, 'rb') as src, open(destination, 'wb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(destination)
+            raise
+
+def fileDigest(path: str) -> Optional[str]:
+    """SHA-256 of a file's content, or None if it cannot be read."""
+    digest = hashlib.sha256()
+    try:
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+class DedupeIndex:
+    """Content-addressed index of saved images, in comics/.dedupe.sqlite.
+
+    Maps (sha256, scope) to the first file saved with that content. The scope
+    is the comic name for per-comic deduplication, or "" to share one index
+    across every comic. Later copies are replaced by a hardlink or reflink to
+    that file. Loaded into memory and written back in batches like CrawlState.
+
+    The original's inode and mtime are recorded too. A file that no longer
+    matches them is hashed again before anything is linked to it.
+    """
+
+    FILENAME = ".dedupe.sqlite"
+    FLUSH_ENTRIES = 50
+    FLUSH_INTERVAL = 10.0
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS files (
+            sha256 TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            path TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            inode INTEGER,
+            mtime_ns INTEGER,
+            PRIMARY KEY (sha256, scope)
+        );
+    """
+
+    def __init__(self, directory: str, method: str = "hardlink") -> None:
+        self.method = method
+        self._lock = threading.RLock()
+        # (sha256, scope) -> (path, size, inode, mtime_ns)
+        self._files: dict[tuple[str, str], tuple[str, int, Optional[int], Optional[int]]] = {}
+        self._pending: dict[tuple[str, str], Optional[tuple[str, int, Optional[int], Optional[int]]]] = {}
+        self._lastFlush = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(os.path.join(directory, self.FILENAME), check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+        columns = {row[1] for row in self._connection.execute("PRAGMA table_info(files)")}
+        for column in ("inode", "mtime_ns"):
+            if column not in columns:
+                # Indexes from before identities were kept; their files are hashed again on first use
+                self._connection.execute(f"ALTER TABLE files ADD COLUMN {column} INTEGER")
+        for sha256, scope, path, size, inode, mtime in self._connection.execute("SELECT sha256, scope, path, size, inode, mtime_ns FROM files"):
+            self._files[(sha256, scope)] = (path, size, inode, mtime)
+
+    def __enter__(self) -> 'DedupeIndex':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Flush the index and close it. Safe to call more than once."""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self.flush()
+            finally:
+                self._connection.close()
+                self._connection = None
+
+    def linkDuplicate(self, sha256: str, size: int, tempPath: str, target: str, scope: str = "") -> bool:
+        """If this content was saved before, make `target` a link to it and delete `tempPath`.
+
+        Returns False (leaving everything untouched) when there is no earlier copy
+        or the filesystem cannot link to it; the caller then keeps its own copy.
+        """
+        with self._lock:
+            known = self._files.get((sha256, scope))
+            if known is None:
+                return False
+            original, originalSize, inode, mtime = known
+            if os.path.abspath(original) == os.path.abspath(target):
+                return False
+            try:
+                stat = os.stat(original)
+            except OSError:
+                stat = None
+            if originalSize != size or stat is None or stat.st_size != size:
+                # The original was removed or replaced since it was indexed
+                self._set((sha256, scope), None)
+                return False
+            verified = (stat.st_ino, stat.st_mtime_ns) == (inode, mtime)
+
+        if not verified:
+            # Changed since it was indexed, possibly with different content of the same size
+            if fileDigest(original) != sha256:
+                with self._lock:
+                    if self._files.get((sha256, scope)) == known:
+                        self._set((sha256, scope), None)
+                return False
+            with self._lock:
+                if self._files.get((sha256, scope)) == known:
+                    self._set((sha256, scope), (original, size, stat.st_ino, stat.st_mtime_ns))
+
+        linkTemp = f"{tempPath}.link"
+        try:
+            if self.method == "reflink":
+                reflink(original, linkTemp)
+            else:
+                os.link(original, linkTemp)
+        except OSError:
+            # Different filesystem, no reflink support, link limit reached, ...
+            return False
+
+        try:
+            os.replace(linkTemp, target)
+        except OSError:
+            os.remove(linkTemp)
+            return False
+        os.remove(tempPath)
+        return True
+
+    def add(self, sha256: str, size: int, path: str, scope: str = "") -> None:
+        """Record `path` as the copy later duplicates in `scope` will link to."""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return
+        with self._lock:
+            if (sha256, scope) not in self._files:
+                self._set((sha256, scope), (path, size, stat.st_ino, stat.st_mtime_ns))
+
+    def _set(self, key: tuple[str, str], value: Optional[tuple[str, int, Optional[int], Optional[int]]]) -> None:
+        if value is None:
+            self._files.pop(key, None)
+        else:
+            self._files[key] = value
+        self._pending[key] = value
+        if len(self._pending) >= self.FLUSH_ENTRIES or time.monotonic() - self._lastFlush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every changed entry back in a single transaction."""
+        with self._lock:
+            self._lastFlush = time.monotonic()
+            if self._connection is None or not self._pending:
+                return
+            with self._connection:
+                for (sha256, scope), value in self._pending.items():
+                    if value is None:
+                        self._connection.execute("DELETE FROM files WHERE sha256 = ? AND scope = ?", (sha256, scope))
+                    else:
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO files (sha256, scope, path, size, inode, mtime_ns) VALUES (?, ?, ?, ?, ?, ?)",
+                            (sha256, scope, *value)
+                        )
+            self._pending.clear()
@@ -1,26 +1,150 @@
-from selenium import webdriver
-from selenium.common import exceptions as SExceptions
-from selenium.webdriver.common.by import By
 import atexit
-from typing import Optional
+import time
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from blocking import BrowserProfile, profilePreferences
+from extraction import IMAGE_ATTRIBUTES, By, PageData, resolveImageURLs
+from memory import processTreeRSS
+from ratelimit import TransientError
+
+# Resolves Selenium locators in the page, shared by the scripts below
+FIND_SCRIPT = """
+function find(locator) {
+    if (!locator) {
+        return [];
+    }
+    const [by, selector] = locator;
+    try {
+        switch (by) {
+            case 'id':
+                // Selenium matches By.ID as [id="..."], which finds every element sharing the id
+                return Array.from(document.querySelectorAll('[id="' + CSS.escape(selector) + '"]'));
+            case 'xpath': {
+                const result = document.evaluate(selector, document, null, XPathResult.ORDERED_NODE_SNAPSHOT_TYPE, null);
+                const nodes = [];
+                for (let i = 0; i < result.snapshotLength; i++) {
+                    nodes.push(result.snapshotItem(i));
+                }
+                return nodes;
+            }
+            case 'link text':
+                return Array.from(document.links).filter(a => a.innerText.trim() === selector);
+            case 'partial link text':
+                return Array.from(document.links).filter(a => a.innerText.includes(selector));
+            case 'name':
+                return Array.from(document.getElementsByName(selector));
+            case 'tag name':
+                return Array.from(document.getElementsByTagName(selector));
+            case 'class name':
+                return Array.from(document.getElementsByClassName(selector));
+            default:
+                return Array.from(document.querySelectorAll(selector));
+        }
+    } catch (e) {
+        return [];
+    }
+}
+
+// Mirror WebElement.get_attribute, which prefers the DOM property (absolute src/href, rendered width)
+function attribute(el, name) {
+    if ((name === 'src' || name === 'href' || name === 'width') && name in el && el[name] !== '') {
+        return String(el[name]);
+    }
+    return el.getAttribute(name);
+}
+"""
+
+# Reads everything extract() needs in one round trip
+EXTRACT_SCRIPT = FIND_SCRIPT + """
+const [imageSelector, titleSelector, nextSelector, imageAttributes] = arguments;
+
+if (window.__comicDownloaderStale) {
+    // load() returned before the new document replaced the previous one
+    return {stale: true, url: window.location.href};
+}
+
+let title = null;
+const titleNode = find(titleSelector)[0];
+if (titleNode) {
+    // XPath '/@attr' selectors resolve to attribute nodes
+    title = titleNode.nodeType === Node.ATTRIBUTE_NODE ? titleNode.value : titleNode.innerText;
+}
+
+const nextNode = find(nextSelector).find(node => node.nodeType === Node.ELEMENT_NODE);
+
+return {
+    images: find(imageSelector)
+        .filter(node => node.nodeType === Node.ELEMENT_NODE)
+        .map(el => Object.fromEntries(imageAttributes.map(name => [name, attribute(el, name)]))),
+    title: title,
+    next: nextNode ? attribute(nextNode, 'href') : null,
+    url: window.location.href,
+    origin: window.location.origin,
+};
+"""
+
+# True once the image selector matches an element with a real (non-placeholder) source
+READY_SCRIPT = FIND_SCRIPT + """
+const [imageSelector] = arguments;
+
+if (window.__comicDownloaderStale) {
+    return false;
+}
+
+function hasRealSource(el) {
+    if (el.getAttribute('data-orig-file') || el.getAttribute('data-image') || el.getAttribute('srcset')) {
+        return true;
+    }
+    const src = el.currentSrc || attribute(el, 'src') || '';
+    if (!src || src === window.location.href) {
+        return false;
+    }
+    // Lazy-loading scripts park a tiny GIF or SVG in src until the real image is swapped in
+    return !src.startsWith('data:image/gif') && !src.startsWith('data:image/svg+xml');
+}
+
+return find(imageSelector).some(node => node.nodeType === Node.ELEMENT_NODE && hasRealSource(node));
+"""
+
+class StalePageError(TransientError):
+    """The browser still shows the previous document; raised so the page is retried."""
 
 class WebComicDownloader:
     def __init__(self,
         browser: str = "firefox",
+        pageLoadStrategy: str = "normal",
+        profile: Optional[BrowserProfile] = None,
         ) -> None:
-        self.driver: Optional[webdriver.Remote] = None
+        self.driver: Optional[Any] = None # selenium.webdriver.Remote
         self.userAgent: Optional[str] = None
+        self.browser = browser
+        self.pageLoadStrategy = pageLoadStrategy
+        self.profile = profile if profile is not None else BrowserProfile()
+        self.pagesLoaded: int = 0
+        self.started = time.monotonic()
+        self.memoryCheckedAt = self.started
+        # Seconds the driver waits for elements to appear, as last set by wait()
+        self.implicitWait: float = 0
         self._closed: bool = False
 
         try:
             if browser.lower() == "firefox":
+                # Imported on first use; selenium alone takes longer to import than most runs need
+                from selenium import webdriver
                 options = webdriver.FirefoxOptions()
                 options.add_argument("-headless")
+                # "eager" returns at DOMContentLoaded, "none" right away; waitUntilReady covers the rest
+                options.page_load_strategy = pageLoadStrategy
                 # Disable caches in Firefox profile (migrated to options preferences)
                 options.set_preference("browser.cache.disk.enable", False)
                 options.set_preference("browser.cache.memory.enable", False)
                 options.set_preference("browser.cache.offline.enable", False)
                 options.set_preference("network.http.use-cache", False)
+                # Skip everything not needed to read <img> attributes and the next link
+                for name, value in profilePreferences(self.profile).items():
+                    options.set_preference(name, value)
                 self.driver = webdriver.Firefox(options=options)
 
             # Register an atexit hook to ensure cleanup even if __del__ is skipped
@@ -64,42 +188,72 @@ class WebComicDownloader:
         except Exception:
             pass
 
-    def _parseSrcset(self, srcset_value: Optional[str]) -> list[tuple[int, str]]:
-        """Parse a srcset string into a list of (width, url) tuples sorted descending by width."""
-        if not srcset_value:
-            return []
-        candidates: list[tuple[int, str]] = []
-        for part in srcset_value.split(','):
-            pieces = part.strip().split()
-            if len(pieces) >= 2 and pieces[1].endswith('w'):
-                url = pieces[0]
-                try:
-                    w_val = int(pieces[1][:-1])  # strip trailing 'w'
-                except ValueError:
-                    continue
-                candidates.append((w_val, url))
-        candidates.sort(key=lambda x: x[0], reverse=True)
-        return candidates
-
-    def load(self, page: str) -> None:
+    def isHealthy(self) -> bool:
+        """Cheap round trip to check the browser is still responding."""
         if not self.driver:
-            raise RuntimeError("WebComicDownloader is closed or not initialized.")
-
-        # Navigate to about:blank first to encourage release of prior page resources
+            return False
         try:
-            self.driver.get("about:blank")
+            return self.driver.execute_script('return 1;') == 1 and bool(self.driver.window_handles)
         except Exception:
-            # Ignore failures to navigate to about:blank and proceed
-            pass
+            return False
+
+    def memoryUsage(self) -> Optional[int]:
+        """Resident memory of geckodriver and the browser processes it started, in bytes."""
+        if not self.driver:
+            return None
+        try:
+            pid = self.driver.service.process.pid
+        except AttributeError:
+            return None
+        return processTreeRSS(pid)
+
+    def load(self, page: str, scroll: bool = False, blankFirst: bool = False) -> None:
+        if not self.driver:
+            raise RuntimeError("WebComicDownloader is closed or not initialized.")
+
+        if blankFirst:
+            # Navigate to about:blank first to encourage release of prior page resources
+            try:
+                self.driver.get("about:blank")
+            except Exception:
+                # Ignore failures to navigate to about:blank and proceed
+                pass
+
+        if self.pageLoadStrategy != "normal":
+            # get() may return before the new document replaces this one; mark it so
+            # waitUntilReady never mistakes the previous page's image for the new one
+            try:
+                self.driver.execute_script("window.__comicDownloaderStale = true;")
+            except Exception:
+                pass
 
         # Now navigate to the requested page
+        self.pagesLoaded += 1
         self.driver.get(page)
-        self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+        if scroll:
+            # Some lazy-loading sites only fill in images once they scroll into view
+            self.driver.execute_script("window.scrollTo(0, document.body.scrollHeight);")
+
+    def waitUntilReady(self, imageSelector: tuple[str, str], timeout: float) -> bool:
+        """Poll until the image selector resolves to an element with a real src. False on timeout."""
+        if not self.driver:
+            raise RuntimeError("WebComicDownloader is closed or not initialized.")
+        from selenium.common.exceptions import TimeoutException
+        from selenium.webdriver.support.ui import WebDriverWait
+        try:
+            WebDriverWait(self.driver, timeout, poll_frequency=0.1).until(
+                lambda driver: driver.execute_script(READY_SCRIPT, list(imageSelector))
+            )
+            return True
+        except TimeoutException:
+            return False
 
     def wait(self, time: float) -> None:
         if not self.driver:
             raise RuntimeError("WebComicDownloader is closed or not initialized.")
         self.driver.implicitly_wait(time)
+        self.implicitWait = time
 
     def getDomain(self) -> str:
         if not self.driver:
@@ -109,6 +263,7 @@ class WebComicDownloader:
     def getTitle(self, elementSelector: tuple[str, str]) -> Optional[str]:
         if not self.driver:
             return None
+        from selenium.common import exceptions as SExceptions
         by, selector = elementSelector
 
         # Support XPath expressions that request an attribute directly via '/@attr'
@@ -143,65 +298,237 @@ class WebComicDownloader:
     def getImageURLs(self, elementSelector: tuple[str, str]) -> Optional[list[str]]:
         if not self.driver:
             return None
+        from selenium.common import exceptions as SExceptions
         try:
             elements = self.driver.find_elements(elementSelector[0], elementSelector[1])
         except SExceptions.NoSuchElementException:
             return None
 
-        urls: list[str] = []
-
-        for el in elements:
-            # 1) Prefer WordPress-specific attributes
-            for attr in ('data-orig-file', 'data-image'):
-                val = el.get_attribute(attr)
-                if val:
-                    urls.append(val)
-                    break
-            else:
-                # 2) Prefer src unless width suggests a larger srcset candidate
-                src = el.get_attribute('src')
-                srcset_value = el.get_attribute('srcset') or ''
-                width_attr = el.get_attribute('width')
-
-                candidates = self._parseSrcset(srcset_value)
-
-                chosen_url: str | None = None
-                if candidates and width_attr is not None:
-                    largest_w, largest_url = candidates[0]
-                    try:
-                        renderedWidth = int(str(width_attr).strip())
-                        if renderedWidth < largest_w:
-                            chosen_url = largest_url
-                    except ValueError:
-                        pass
-
-                if chosen_url:
-                    urls.append(chosen_url)
-                else:
-                    # Prefer src if present; otherwise, fall back to largest srcset candidate if available
-                    if src:
-                        urls.append(src)
-                    elif candidates:
-                        urls.append(candidates[0][1])
-
-        if not urls:
-            return None
-
-        # De-duplicate while preserving order
-        seen: set[str] = set()
-        deDuped: list[str] = []
-        for u in urls:
-            if u and u not in seen:
-                seen.add(u)
-                deDuped.append(u)
-
-        return deDuped if deDuped else None
+        # Selection between WordPress attributes, src and srcset is shared with the HTTP engine
+        return resolveImageURLs(
+            [{attr: el.get_attribute(attr) for attr in IMAGE_ATTRIBUTES} for el in elements],
+            self.driver.current_url
+        )
 
     def getLink(self, elementSelector: tuple[str, str]) -> Optional[str]:
         if not self.driver:
             return None
+        from selenium.common import exceptions as SExceptions
         try:
             elem = self.driver.find_element(elementSelector[0], elementSelector[1])
         except SExceptions.NoSuchElementException:
             return None
         return elem.get_attribute('href')
+
+    def extract(self,
+        imageSelector: tuple[str, str],
+        titleSelector: Optional[tuple[str, str]] = None,
+        nextSelector: Optional[tuple[str, str]] = None,
+        ) -> PageData:
+        """Gather the images, title, next link and origin of the loaded page in one execute_script call."""
+        if not self.driver:
+            raise RuntimeError("WebComicDownloader is closed or not initialized.")
+
+        result = self.driver.execute_script(
+            EXTRACT_SCRIPT,
+            list(imageSelector),
+            list(titleSelector) if titleSelector else None,
+            list(nextSelector) if nextSelector else None,
+            list(IMAGE_ATTRIBUTES)
+        )
+
+        if result.get('stale'):
+            raise StalePageError(f"Page did not replace {result['url']} in time")
+
+        if not result['images'] and self.implicitWait:
+            # The script does not honour the implicit wait set by wait(); give late elements the usual chance.
+            # Without one, waitUntilReady has already polled for the image and there is nothing to add
+            return PageData(
+                self.getImageURLs(imageSelector),
+                self.getTitle(titleSelector) if titleSelector else None,
+                self.getLink(nextSelector) if nextSelector else None,
+                result['origin']
+            )
+
+        title = result['title'].strip() if result['title'] else ''
+        return PageData(
+            resolveImageURLs(result['images'], result['url']),
+            title if title else None,
+            result['next'],
+            result['origin']
+        )
+
+class WebDriverPool:
+    """Reusable, pre-warmed WebComicDownloader instances.
+
+    Browsers are handed out by acquire() after a health check and returned with
+    release(). A browser is recycled once it has loaded maxPages pages or its
+    process tree uses more than maxRSS bytes (checked at most every
+    memoryInterval seconds, since that lists every process), and `spares` idle browsers are
+    started in the background so callers rarely wait for a cold start.
+
+    Browsers only serve comics with the same BrowserProfile. Spares are warmed
+    with the profile most recently asked for; idle browsers with any other
+    profile are closed so they do not hold the spare slots.
+    """
+
+    def __init__(self,
+        browser: str = "firefox",
+        pageLoadStrategy: str = "normal",
+        profile: Optional[BrowserProfile] = None,
+        spares: int = 1,
+        maxPages: int = 100,
+        maxRSS: Optional[int] = None,
+        memoryInterval: float = 10.0,
+        ) -> None:
+        self.browser = browser
+        self.pageLoadStrategy = pageLoadStrategy
+        self.profile = profile if profile is not None else BrowserProfile()
+        self.spares = max(0, spares)
+        self.maxPages = maxPages
+        self.maxRSS = maxRSS
+        self.memoryInterval = memoryInterval
+        self._idle: list[WebComicDownloader] = []
+        self._warming: int = 0
+        # Browsers started before this are recycled; see recycleAll()
+        self._recycleBefore: float = 0.0
+        self._condition = threading.Condition()
+        self._closed: bool = False
+
+    def __enter__(self) -> 'WebDriverPool':
+        self._warm()
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Close every idle browser. Browsers still leased are closed when released."""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for downloader in idle:
+            downloader.close()
+
+    def acquire(self, profile: Optional[BrowserProfile] = None) -> WebComicDownloader:
+        """Hand out a healthy browser with `profile`, preferring a pre-warmed spare."""
+        if profile is None:
+            profile = self.profile
+
+        while True:
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("WebDriverPool is closed.")
+                self.profile = profile
+                downloader = None
+                for index in range(len(self._idle) - 1, -1, -1):
+                    if self._idle[index].profile == profile:
+                        downloader = self._idle.pop(index)
+                        break
+
+            if downloader is None:
+                # Nothing warm; start one in this thread rather than waiting on the warmer
+                downloader = WebComicDownloader(self.browser, self.pageLoadStrategy, profile)
+            elif not downloader.isHealthy():
+                downloader.close()
+                continue
+
+            self._warm()
+            return downloader
+
+    def release(self, downloader: WebComicDownloader) -> None:
+        """Return a browser to the pool, recycling it if it is worn out or unhealthy."""
+        with self._condition:
+            keep = not self._closed and len(self._idle) < self.spares and downloader.profile == self.profile
+        if keep and not self._needsRecycle(downloader) and downloader.isHealthy():
+            with self._condition:
+                if not self._closed and downloader.profile == self.profile:
+                    self._idle.append(downloader)
+                    return
+        downloader.close()
+        self._warm()
+
+    def discard(self, downloader: WebComicDownloader) -> None:
+        """Close a browser that misbehaved instead of returning it."""
+        downloader.close()
+        self._warm()
+
+    def recycleAll(self) -> None:
+        """Close the idle browsers now and have every leased one swapped at its next renew()."""
+        with self._condition:
+            self._recycleBefore = time.monotonic()
+            idle, self._idle = self._idle, []
+        for downloader in idle:
+            downloader.close()
+        self._warm()
+
+    def renew(self, downloader: WebComicDownloader) -> WebComicDownloader:
+        """Swap a browser for a fresh one if it has reached its page or memory budget."""
+        if not self._needsRecycle(downloader):
+            return downloader
+        downloader.close()
+        return self.acquire(downloader.profile)
+
+    @contextmanager
+    def lease(self, profile: Optional[BrowserProfile] = None) -> Iterator[WebComicDownloader]:
+        downloader = self.acquire(profile)
+        try:
+            yield downloader
+        finally:
+            self.release(downloader)
+
+    def _needsRecycle(self, downloader: WebComicDownloader) -> bool:
+        if downloader.started <= self._recycleBefore:
+            return True
+        if self.maxPages and downloader.pagesLoaded >= self.maxPages:
+            return True
+        if self.maxRSS:
+            now = time.monotonic()
+            if now - downloader.memoryCheckedAt < self.memoryInterval:
+                return False
+            downloader.memoryCheckedAt = now
+            usage = downloader.memoryUsage()
+            if usage is not None and usage > self.maxRSS:
+                return True
+        return False
+
+    def _warm(self) -> None:
+        """Start spare browsers in the background until `spares` with the current profile are idle or starting."""
+        with self._condition:
+            stale = [downloader for downloader in self._idle if downloader.profile != self.profile]
+            self._idle = [downloader for downloader in self._idle if downloader.profile == self.profile]
+            missing = 0 if self._closed else self.spares - len(self._idle) - self._warming
+            if missing > 0:
+                self._warming += missing
+            profile = self.profile
+        for downloader in stale:
+            downloader.close()
+        if missing <= 0:
+            return
+        for _ in range(missing):
+            threading.Thread(target=self._startSpare, args=(profile,), name="webdriver-warmer", daemon=True).start()
+
+    def _startSpare(self, profile: BrowserProfile) -> None:
+        downloader: Optional[WebComicDownloader] = None
+        try:
+            downloader = WebComicDownloader(self.browser, self.pageLoadStrategy, profile)
+        except Exception:
+            # acquire() falls back to a cold start; nothing to report here
+            pass
+        finally:
+            with self._condition:
+                self._warming -= 1
+                # A browser released while this one was starting may already fill the spare slot
+                if downloader is not None and not self._closed and len(self._idle) < self.spares and profile == self.profile:
+                    self._idle.append(downloader)
+                    downloader = None
+                self._condition.notify_all()
+            if downloader is not None:
+                downloader.close()
+                # The profile may have changed while it was starting
+                self._warm()
@@ -0,0 +1,92 @@
+from typing import NamedTuple, Optional
+from urllib.parse import urljoin
+
+class By:
+    """Locator strategies, with the same values as selenium's By so importing selenium is not needed to name them."""
+    ID = "id"
+    XPATH = "xpath"
+    LINK_TEXT = "link text"
+    PARTIAL_LINK_TEXT = "partial link text"
+    NAME = "name"
+    TAG_NAME = "tag name"
+    CLASS_NAME = "class name"
+    CSS_SELECTOR = "css selector"
+
+# Attribute names read from every matched <img>, in the order they are preferred
+IMAGE_ATTRIBUTES = ('data-orig-file', 'data-image', 'src', 'srcset', 'width')
+
+class PageData(NamedTuple):
+    """Everything the crawler needs from one page, gathered in a single pass."""
+    imageURLs: Optional[list[str]]
+    title: Optional[str]
+    nextURL: Optional[str]
+    domain: str
+
+def parseSrcset(srcset_value: Optional[str]) -> list[tuple[int, str]]:
+    """Parse a srcset string into a list of (width, url) tuples sorted descending by width."""
+    if not srcset_value:
+        return []
+    candidates: list[tuple[int, str]] = []
+    for part in srcset_value.split(','):
+        pieces = part.strip().split()
+        if len(pieces) >= 2 and pieces[1].endswith('w'):
+            url = pieces[0]
+            try:
+                w_val = int(pieces[1][:-1])  # strip trailing 'w'
+            except ValueError:
+                continue
+            candidates.append((w_val, url))
+    candidates.sort(key=lambda x: x[0], reverse=True)
+    return candidates
+
+def chooseImageURL(attributes: dict[str, Optional[str]]) -> Optional[str]:
+    """Pick the best image URL from the attributes of a single <img> element."""
+    # 1) Prefer WordPress-specific attributes
+    for attr in ('data-orig-file', 'data-image'):
+        val = attributes.get(attr)
+        if val:
+            return val
+
+    # 2) Prefer src unless width suggests a larger srcset candidate
+    src = attributes.get('src')
+    srcset_value = attributes.get('srcset') or ''
+    width_attr = attributes.get('width')
+
+    candidates = parseSrcset(srcset_value)
+
+    if candidates and width_attr is not None:
+        largest_w, largest_url = candidates[0]
+        try:
+            renderedWidth = int(str(width_attr).strip())
+            if renderedWidth < largest_w:
+                return largest_url
+        except ValueError:
+            pass
+
+    # Prefer src if present; otherwise, fall back to largest srcset candidate if available
+    if src:
+        return src
+    elif candidates:
+        return candidates[0][1]
+    return None
+
+def resolveImageURLs(elements: list[dict[str, Optional[str]]], baseURL: Optional[str] = None) -> Optional[list[str]]:
+    """Resolve the attributes of every matched <img> into a de-duplicated list of absolute URLs."""
+    urls: list[str] = []
+    for attributes in elements:
+        url = chooseImageURL(attributes)
+        if url:
+            urls.append(urljoin(baseURL, url.strip()) if baseURL else url.strip())
+
+    if not urls:
+        return None
+
+    # De-duplicate while preserving order
+    seen: set[str] = set()
+    deDuped: list[str] = []
+    for u in urls:
+        if u and u not in seen:
+            seen.add(u)
+            deDuped.append(u)
+
+    return deDuped if deDuped else None
@@ -0,0 +1,230 @@
+import os
+import hashlib
+import mimetypes
+import requests
+from requests.adapters import HTTPAdapter
+from typing import NamedTuple, Optional
+from urllib.parse import urlsplit
+
+from httpcache import HttpCache
+from dedupe import DedupeIndex
+
+# Leading bytes of the image formats comics are published in
+MAGIC_NUMBERS: list[tuple[bytes, int, str]] = [
+    (b'\x89PNG\r\n\x1a\n', 0, '.png'),
+    (b'\xff\xd8\xff', 0, '.jpg'),
+    (b'GIF87a', 0, '.gif'),
+    (b'GIF89a', 0, '.gif'),
+    (b'WEBP', 8, '.webp'),
+    (b'ftypavif', 4, '.avif'),
+    (b'BM', 0, '.bmp'),
+    (b'II*\x00', 0, '.tiff'),
+    (b'MM\x00*', 0, '.tiff'),
+]
+
+# Content types that say nothing about the actual format
+GENERIC_CONTENT_TYPES = {"application/octet-stream", "binary/octet-stream", "application/binary", "text/plain"}
+
+def sniffExtension(head: bytes) -> Optional[str]:
+    for magic, offset, extension in MAGIC_NUMBERS:
+        if head[offset:offset + len(magic)] == magic:
+            return extension
+    return None
+
+def detectExtension(contentType: Optional[str], head: bytes, url: str, fallbackExtension: str) -> str:
+    """Work out a file extension from the Content-Type, then the first bytes, then the URL."""
+    if contentType:
+        contentType = contentType.split(';')[0].strip().lower()
+        if contentType and contentType not in GENERIC_CONTENT_TYPES:
+            extension = mimetypes.guess_extension(contentType)
+            if extension:
+                return extension
+
+    extension = sniffExtension(head)
+    if extension:
+        return extension
+
+    if not url.startswith('data:'):
+        guessed, _ = mimetypes.guess_type(urlsplit(url).path)
+        if guessed:
+            extension = mimetypes.guess_extension(guessed)
+            if extension:
+                return extension
+
+    return f".{fallbackExtension}"
+
+class FetchResult(NamedTuple):
+    filename: str
+    size: int
+    sha256: str
+    etag: Optional[str] = None
+    lastModified: Optional[str] = None
+    notModified: bool = False # 304: the copy on disk is current and nothing was written
+    deduplicated: bool = False # linked to an identical file saved earlier instead of written
+
+NOT_MODIFIED = FetchResult("", 0, "", notModified=True)
+
+class ImageFetcher:
+    """Streams images to disk over one shared, keep-alive requests.Session.
+
+    With a cache, the validators of every image are remembered so a re-download
+    of a file that is already on disk can be answered with 304 Not Modified.
+    With a dedupe index, content that was saved before becomes a link to the
+    earlier file instead of a second copy.
+    """
+
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self,
+        poolSize: int = 10,
+        timeout: float = 60,
+        cache: Optional[HttpCache] = None,
+        dedupe: Optional[DedupeIndex] = None,
+        ) -> None:
+        self.timeout = timeout
+        self.cache = cache
+        self.dedupe = dedupe
+        self.session: Optional[requests.Session] = requests.Session()
+        adapter = HTTPAdapter(pool_connections=poolSize, pool_maxsize=poolSize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._closed: bool = False
+
+    def __enter__(self) -> 'ImageFetcher':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Idempotent cleanup of the pooled connections."""
+        if self._closed:
+            return
+        self._closed = True
+        if self.session is not None:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+            finally:
+                self.session = None
+
+    def download(self,
+        url: str,
+        directory: str,
+        stem: str,
+        fallbackExtension: str,
+        headers: Optional[dict] = None,
+        conditional: bool = False,
+        dedupeScope: Optional[str] = None,
+        ) -> Optional[FetchResult]:
+        """GET `url` once and stream it to `directory/stem.ext`.
+
+        With `conditional`, cached validators are sent and NOT_MODIFIED is returned
+        on a 304; only ask for that when the file is already on disk.
+        `dedupeScope` enables deduplication against files saved in that scope.
+        Returns None when the body was empty.
+        """
+        if not self.session:
+            raise RuntimeError("ImageFetcher is closed or not initialized.")
+
+        headers = dict(headers or {})
+        if conditional and self.cache is not None:
+            headers.update(self.cache.validators(url))
+
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout) as response:
+            if response.status_code == 304 and conditional and self.cache is not None:
+                self.cache.touch(url)
+                return NOT_MODIFIED
+            response.raise_for_status()
+            chunks = response.iter_content(self.CHUNK_SIZE)
+
+            # The first chunk is enough to sniff the format when the headers are unhelpful
+            head = b''
+            for chunk in chunks:
+                head = chunk
+                if head:
+                    break
+
+            if not head:
+                return None
+
+            extension = detectExtension(response.headers.get('content-type'), head, url, fallbackExtension)
+            filename = f"{stem}{extension}"
+            size, digest, deduplicated = self._writeAtomic(directory, filename, head, chunks, dedupeScope)
+
+            if self.cache is not None:
+                self.cache.store(url, response.headers.get('etag'), response.headers.get('last-modified'))
+
+            return FetchResult(filename, size, digest, response.headers.get('etag'), response.headers.get('last-modified'), deduplicated=deduplicated)
+
+    def save(self,
+        content: bytes,
+        contentType: Optional[str],
+        directory: str,
+        stem: str,
+        fallbackExtension: str,
+        dedupeScope: Optional[str] = None,
+        ) -> Optional[FetchResult]:
+        """Write an already decoded body (e.g. from a data: URI) the same way download does."""
+        if not content:
+            return None
+        extension = detectExtension(contentType, content[:32], 'data:', fallbackExtension)
+        filename = f"{stem}{extension}"
+        size, digest, deduplicated = self._writeAtomic(directory, filename, content, iter(()), dedupeScope)
+        return FetchResult(filename, size, digest, deduplicated=deduplicated)
+
+    def _writeAtomic(self, directory: str, filename: str, head: bytes, chunks, dedupeScope: Optional[str] = None) -> tuple[int, str, bool]:
+        """Stream `head` and `chunks` into `directory/filename`.
+
+        Returns (size, sha256 hex digest, whether it became a link to an earlier copy).
+        """
+        # Write to a hidden temp file next to the target so the rename stays on one filesystem
+        fd, tempPath = self._createTemp(directory)
+        size = 0
+        digest = hashlib.sha256()
+        try:
+            with os.fdopen(fd, 'wb') as file:
+                if head:
+                    file.write(head)
+                    digest.update(head)
+                    size += len(head)
+                for chunk in chunks:
+                    if chunk:
+                        file.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+            target = os.path.join(directory, filename)
+            hexdigest = digest.hexdigest()
+
+            # The digest is only known once the body is in; swap the temp file for a link if it is a repeat
+            if self.dedupe is not None and dedupeScope is not None:
+                if self.dedupe.linkDuplicate(hexdigest, size, tempPath, target, dedupeScope):
+                    return size, hexdigest, True
+
+            os.replace(tempPath, target)
+
+            if self.dedupe is not None and dedupeScope is not None:
+                self.dedupe.add(hexdigest, size, target, dedupeScope)
+        except BaseException:
+            try:
+                os.remove(tempPath)
+            except OSError:
+                pass
+            raise
+        return size, hexdigest, False
+
+    def _createTemp(self, directory: str) -> tuple[int, str]:
+        """Create a uniquely named temp file in `directory`; returns (fd, path).
+
+        Unlike mkstemp, which makes files readable only by us, the file is
+        created with the permissions the umask gives any new file.
+        """
+        while True:
+            path = os.path.join(directory, f".{os.urandom(8).hex()}.part")
+            try:
+                return os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, 'O_BINARY', 0), 0o666), path
+            except FileExistsError:
+                continue
@@ -0,0 +1,200 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from typing import Any, Optional
+
+class HttpCache:
+    """On-disk HTTP cache of validators (ETag/Last-Modified) and, for pages, bodies.
+
+    Kept under comics/.cache with an index in cache.sqlite. Images only keep
+    their validators; their body is the saved file itself. Like CrawlState,
+    the index lives in memory and is written back in batches. Every entry
+    counts ENTRY_BYTES towards maxBytes on top of its body, so the index stays
+    bounded too. Once over maxBytes, entries are evicted least-recently-used
+    first until EVICT_TO of it is used.
+    """
+
+    INDEX = "cache.sqlite"
+    FLUSH_ENTRIES = 50
+    FLUSH_INTERVAL = 10.0
+    # Roughly what one entry costs in memory
+    ENTRY_BYTES = 1024
+    # Evicting below the limit means the index is not sorted again on every store
+    EVICT_TO = 0.9
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS entries (
+            url TEXT PRIMARY KEY,
+            etag TEXT,
+            last_modified TEXT,
+            body TEXT,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL
+        );
+    """
+
+    def __init__(self, directory: str, maxBytes: int = 256 * 1024 * 1024) -> None:
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self._lock = threading.RLock()
+        self._entries: dict[str, dict[str, Any]] = {}
+        self._dirty: set[str] = set()
+        self._deleted: set[str] = set()
+        self._totalBytes = 0
+        self._lastFlush = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(os.path.join(directory, self.INDEX), check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+        for url, etag, lastModified, body, size, lastUsed in self._connection.execute(
+            "SELECT url, etag, last_modified, body, size, last_used FROM entries"):
+            self._entries[url] = {
+                "etag": etag,
+                "last_modified": lastModified,
+                "body": body,
+                "size": size,
+                "last_used": lastUsed,
+            }
+            self._totalBytes += size + self.ENTRY_BYTES
+        self._evict()
+
+    def __enter__(self) -> 'HttpCache':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Flush the index and close it. Safe to call more than once."""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self.flush()
+            finally:
+                self._connection.close()
+                self._connection = None
+
+    def validators(self, url: str) -> dict[str, str]:
+        """Conditional request headers for `url`; empty when nothing is cached."""
+        with self._lock:
+            entry = self._entries.get(url)
+            headers: dict[str, str] = {}
+            if entry:
+                if entry["etag"]:
+                    headers["If-None-Match"] = entry["etag"]
+                if entry["last_modified"]:
+                    headers["If-Modified-Since"] = entry["last_modified"]
+            return headers
+
+    def body(self, url: str) -> Optional[bytes]:
+        """The cached body for `url` (after a 304), or None if it was never stored or was evicted."""
+        with self._lock:
+            entry = self._entries.get(url)
+            if not entry or not entry["body"]:
+                return None
+            try:
+                with open(os.path.join(self.directory, entry["body"]), 'rb') as file:
+                    content = file.read()
+            except OSError:
+                self._remove(url)
+                return None
+            self.touch(url)
+            return content
+
+    def touch(self, url: str) -> None:
+        with self._lock:
+            entry = self._entries.get(url)
+            if entry:
+                entry["last_used"] = time.time()
+                self._markDirty(url)
+
+    def store(self, url: str, etag: Optional[str], lastModified: Optional[str], content: Optional[bytes] = None) -> None:
+        """Remember the validators for `url`, and its body if given. Without validators nothing is kept."""
+        with self._lock:
+            if not etag and not lastModified:
+                self._remove(url)
+                return
+
+            previous = self._entries.get(url)
+            bodyName: Optional[str] = None
+            size = 0
+            if content is not None:
+                bodyName = hashlib.sha256(url.encode()).hexdigest()
+                temp = os.path.join(self.directory, f".{bodyName}.part")
+                with open(temp, 'wb') as file:
+                    file.write(content)
+                os.replace(temp, os.path.join(self.directory, bodyName))
+                size = len(content)
+            elif previous and previous["body"]:
+                self._removeBody(previous["body"])
+
+            if previous:
+                self._totalBytes -= previous["size"] + self.ENTRY_BYTES
+            self._totalBytes += size + self.ENTRY_BYTES
+            self._entries[url] = {
+                "etag": etag,
+                "last_modified": lastModified,
+                "body": bodyName,
+                "size": size,
+                "last_used": time.time(),
+            }
+            self._deleted.discard(url)
+            self._markDirty(url)
+            self._evict()
+
+    def _evict(self) -> None:
+        if self._totalBytes <= self.maxBytes:
+            return
+        target = self.maxBytes * self.EVICT_TO
+        for _, url in sorted((entry["last_used"], url) for url, entry in self._entries.items()):
+            if self._totalBytes <= target:
+                break
+            self._remove(url)
+
+    def _remove(self, url: str) -> None:
+        entry = self._entries.pop(url, None)
+        if entry is None:
+            return
+        self._totalBytes -= entry["size"] + self.ENTRY_BYTES
+        if entry["body"]:
+            self._removeBody(entry["body"])
+        self._dirty.discard(url)
+        self._deleted.add(url)
+        self._maybeFlush()
+
+    def _removeBody(self, name: str) -> None:
+        try:
+            os.remove(os.path.join(self.directory, name))
+        except OSError:
+            pass
+
+    def _markDirty(self, url: str) -> None:
+        self._dirty.add(url)
+        self._maybeFlush()
+
+    def _maybeFlush(self) -> None:
+        if len(self._dirty) + len(self._deleted) >= self.FLUSH_ENTRIES or time.monotonic() - self._lastFlush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Write every changed entry back to the index in a single transaction."""
+        with self._lock:
+            self._lastFlush = time.monotonic()
+            if self._connection is None or (not self._dirty and not self._deleted):
+                return
+            with self._connection:
+                self._connection.executemany("DELETE FROM entries WHERE url = ?", [(url,) for url in self._deleted])
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO entries (url, etag, last_modified, body, size, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                    [
+                        (url, entry["etag"], entry["last_modified"], entry["body"], entry["size"], entry["last_used"])
+                        for url, entry in ((url, self._entries[url]) for url in self._dirty if url in self._entries)
+                    ]
+                )
+            self._dirty.clear()
+            self._deleted.clear()
@@ -0,0 +1,210 @@
+import requests
+from lxml import html, etree
+from lxml.cssselect import CSSSelector, SelectorError
+from typing import Optional
+from urllib.parse import urljoin, urlsplit
+
+from extraction import IMAGE_ATTRIBUTES, PageData, resolveImageURLs
+from httpcache import HttpCache
+
+# Sent in place of the browser's navigator.userAgent
+DEFAULT_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"
+
+class HttpComicDownloader:
+    """Browser-less engine for static comic sites: a plain GET parsed with lxml.
+
+    Exposes the same surface as WebComicDownloader, and accepts the same
+    (By, selector) tuples produced by Application.resolveSelectorType.
+    With a cache, pages are requested conditionally and a 304 reuses the
+    stored body. A page that is missing (404 or 410) loads as an empty
+    document, as the browser shows an error page with no images, so the
+    walk ends there instead of failing the comic.
+    """
+
+    MISSING_STATUSES = (404, 410)
+
+    def __init__(self,
+        userAgent: str = DEFAULT_USER_AGENT,
+        timeout: float = 30,
+        cache: Optional[HttpCache] = None,
+        ) -> None:
+        self.userAgent: Optional[str] = userAgent
+        self.timeout = timeout
+        self.cache = cache
+        self.session: Optional[requests.Session] = requests.Session()
+        self.session.headers["User-Agent"] = userAgent
+        self._document: Optional[html.HtmlElement] = None
+        self._url: Optional[str] = None
+        self._closed: bool = False
+
+    def __enter__(self) -> 'HttpComicDownloader':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Idempotent cleanup of the HTTP session."""
+        if self._closed:
+            return
+        self._closed = True
+        self._document = None
+        if self.session is not None:
+            try:
+                self.session.close()
+            except Exception:
+                pass
+            finally:
+                self.session = None
+
+    def _toXPath(self, elementSelector: tuple[str, str]) -> str:
+        """Translate a Selenium locator into an XPath expression lxml can evaluate."""
+        by, selector = elementSelector
+        literal = self._xpathLiteral(selector)
+        if by == "xpath":
+            return selector
+        elif by == "css selector":
+            return CSSSelector(selector).path
+        elif by == "class name":
+            return f"//*[contains(concat(' ', normalize-space(@class), ' '), concat(' ', {literal}, ' '))]"
+        elif by == "name":
+            return f"//*[@name={literal}]"
+        elif by == "tag name":
+            return f"//*[local-name()={literal}]"
+        elif by == "link text":
+            return f"//a[normalize-space(.)={literal}]"
+        elif by == "partial link text":
+            return f"//a[contains(., {literal})]"
+        else: # Default to ID
+            return f"//*[@id={literal}]"
+
+    def _xpathLiteral(self, value: str) -> str:
+        if "'" not in value:
+            return f"'{value}'"
+        if '"' not in value:
+            return f'"{value}"'
+        parts = value.split("'")
+        return "concat(" + ", \"'\", ".join(f"'{part}'" for part in parts) + ")"
+
+    def _find(self, elementSelector: tuple[str, str]) -> list:
+        if self._document is None:
+            return []
+        try:
+            result = self._document.xpath(self._toXPath(elementSelector))
+        except (etree.XPathError, SelectorError, ValueError):
+            return []
+        return result if isinstance(result, list) else [result]
+
+    def load(self, page: str, scroll: bool = False, blankFirst: bool = False) -> None:
+        # scroll and blankFirst only matter to a browser; accepted for a common signature
+        if not self.session:
+            raise RuntimeError("HttpComicDownloader is closed or not initialized.")
+
+        cached = self.cache.body(page) if self.cache is not None else None
+        headers = self.cache.validators(page) if cached is not None else {}
+
+        response = self.session.get(page, headers=headers, timeout=self.timeout)
+        if response.status_code in self.MISSING_STATUSES:
+            self._url = response.url
+            self._document = None
+            return
+        if response.status_code == 304 and cached is not None:
+            content = cached
+        else:
+            response.raise_for_status()
+            content = response.content
+            if self.cache is not None:
+                self.cache.store(page, response.headers.get('etag'), response.headers.get('last-modified'), content)
+
+        self._url = response.url
+        self._document = html.fromstring(content, base_url=response.url)
+
+        # Honour <base href> the same way the browser would when resolving links
+        base = self._document.xpath('//base/@href')
+        if base:
+            self._url = urljoin(response.url, base[0].strip())
+
+    def waitUntilReady(self, imageSelector: tuple[str, str], timeout: float) -> bool:
+        # Nothing renders later; the document is final once load returns
+        return True
+
+    def wait(self, time: float) -> None:
+        # The whole document is available once load returns
+        if not self.session:
+            raise RuntimeError("HttpComicDownloader is closed or not initialized.")
+
+    def getDomain(self) -> str:
+        if not self.session:
+            raise RuntimeError("HttpComicDownloader is closed or not initialized.")
+        parts = urlsplit(self._url or "")
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def getTitle(self, elementSelector: tuple[str, str]) -> Optional[str]:
+        if not self.session:
+            return None
+
+        # XPath expressions ending in '/@attr' evaluate straight to attribute strings
+        for match in self._find(elementSelector):
+            if isinstance(match, str):
+                text = match
+            elif isinstance(match, html.HtmlElement):
+                text = match.text_content()
+            else:
+                continue
+            text = text.strip() if text else ''
+            return text if text else None
+        return None
+
+    def getImageURLs(self, elementSelector: tuple[str, str]) -> Optional[list[str]]:
+        if not self.session:
+            return None
+        elements = [el for el in self._find(elementSelector) if isinstance(el, html.HtmlElement)]
+
+        # Selection between WordPress attributes, src and srcset is shared with the Selenium engine
+        return resolveImageURLs(
+            [{attr: el.get(attr) for attr in IMAGE_ATTRIBUTES} for el in elements],
+            self._url
+        )
+
+    def getLinks(self, elementSelector: tuple[str, str]) -> list[str]:
+        """Every href matched by the selector, resolved and without duplicates, in document order."""
+        links: list[str] = []
+        seen: set[str] = set()
+        for el in self._find(elementSelector):
+            if isinstance(el, html.HtmlElement):
+                href = el.get('href')
+            elif isinstance(el, str):
+                # An XPath ending in /@href
+                href = el
+            else:
+                continue
+            if href and href.strip():
+                url = urljoin(self._url, href.strip()).split('#')[0]
+                if url not in seen:
+                    seen.add(url)
+                    links.append(url)
+        return links
+
+    def getLink(self, elementSelector: tuple[str, str]) -> Optional[str]:
+        if not self.session:
+            return None
+        for el in self._find(elementSelector):
+            if isinstance(el, html.HtmlElement):
+                href = el.get('href')
+                return urljoin(self._url, href.strip()) if href else None
+        return None
+
+    def extract(self,
+        imageSelector: tuple[str, str],
+        titleSelector: Optional[tuple[str, str]] = None,
+        nextSelector: Optional[tuple[str, str]] = None,
+        ) -> PageData:
+        """Gather the images, title, next link and origin of the loaded page."""
+        return PageData(
+            self.getImageURLs(imageSelector),
+            self.getTitle(titleSelector) if titleSelector else None,
+            self.getLink(nextSelector) if nextSelector else None,
+            self.getDomain()
+        )
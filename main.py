@@ -1,17 +1,57 @@
 import os
-import requests
-import mimetypes
+import re
+import time
 import base64
+import argparse
+import threading
+from typing import TYPE_CHECKING, Any, Callable
+from urllib.parse import urlsplit
 
-from selenium.webdriver.common.by import By
 from sanitize_filename import sanitize
 
-from downloader import WebComicDownloader
+from downloader import StalePageError, WebComicDownloader, WebDriverPool
+from blocking import BrowserProfile
+from extraction import By, PageData
+from archive import discoverPages, validateArchive
+from pipeline import DownloadJob, DownloadPipeline
+from state import CrawlState
+from ratelimit import RateLimiter
+from httpcache import HttpCache
+from dedupe import DedupeIndex
+from metrics import Metrics, MetricsServer
+from memory import MemoryGovernor
+from workqueue import WorkQueue, QueuePipeline, RecordedImage
+from packing import PACK_MODES, CbzPacker
 from config import Config
 
+if TYPE_CHECKING:
+    # requests and lxml are imported on first use so maintenance commands start instantly
+    from httpdownloader import HttpComicDownloader
+    from fetcher import ImageFetcher
+
 class Application:
     def __init__(self, config: Config) -> None:
         self.config = config
+        self._comics: list[dict] = []
+        self._parallel: bool = False
+        self._update: bool = False
+        self.newPages: dict[str, int] = {}
+        self.failures: dict[str, str] = {}
+        self._rateLimiter: RateLimiter = RateLimiter()
+        self._printLock = threading.Lock()
+        self._fetcher: 'ImageFetcher | None' = None
+        self._httpCache: HttpCache | None = None
+        self._dedupe: DedupeIndex | None = None
+        self.metrics: Metrics = Metrics()
+        self._governor: MemoryGovernor | None = None
+        self._metricsServer: MetricsServer | None = None
+        self._queue: WorkQueue | None = None
+        self.bytesSaved: dict[str, int] = {}
+        self.filesLinked: dict[str, int] = {}
+        self._driverPool: WebDriverPool | None = None
+        self._driverPoolLock = threading.Lock()
+        self._existingFiles: dict[str, dict[str, str]] = {}
+        self._filesLock = threading.Lock()
 
     def resolveSelectorType(self, selector: list) -> tuple:
         if selector[0] == "id":
@@ -34,194 +74,1071 @@ class Application:
             selectorTuple = (By.ID, selector[1])
         return selectorTuple
 
-    def downloadComics(self) -> None:
-        comics: list[dict] = self.config.get('comics')
-        nextPage: str | None = None
+    def createDownloader(self, engine: str | None, profile: BrowserProfile | None = None) -> 'WebComicDownloader | HttpComicDownloader':
+        if engine == "http":
+            from httpdownloader import HttpComicDownloader
+            return HttpComicDownloader(cache=self._httpCache)
+        return self.getDriverPool().acquire(profile)
 
-        if not comics:
-            print("No comics to download")
-            exit()
+    def getBrowserProfile(self, comic: dict) -> BrowserProfile:
+        allowedDomains = [domain.lower() for domain in comic.get('allowed_domains') or []]
+        if allowedDomains:
+            # The comic's own site is always reachable
+            host = self.getHost(comic.get('url') or "")
+            if host.startswith("www."):
+                host = host[4:]
+            if host and host not in allowedDomains:
+                allowedDomains.append(host)
 
-        delay = self.config.get('delay') or 0.25
-        fallbackExension = self.config.get('fallback_extension') or "png"
+        return BrowserProfile(
+            blockImages=self.config.get('block_images') == True,
+            blockFonts=self.config.get('block_fonts') == True,
+            blockMedia=self.config.get('block_media') == True,
+            blockTrackers=self.config.get('block_trackers') == True,
+            allowedDomains=tuple(sorted(allowedDomains))
+        )
+
+    def releaseDownloader(self, downloader: 'WebComicDownloader | HttpComicDownloader', broken: bool = False) -> None:
+        if isinstance(downloader, WebComicDownloader) and self._driverPool is not None:
+            if broken:
+                self._driverPool.discard(downloader)
+            else:
+                self._driverPool.release(downloader)
+        else:
+            downloader.close()
+
+    def replaceDownloader(self,
+        comicName: str,
+        downloader: 'WebComicDownloader | HttpComicDownloader',
+        url: str,
+        error: BaseException,
+        attempt: int,
+        engine: str,
+        profile: BrowserProfile,
+        ) -> 'WebComicDownloader | HttpComicDownloader':
+        """Before a page is retried: log it and swap the downloader that failed for a fresh one."""
+        self.log(comicName, f"Retrying ({attempt}): {url}: {error}")
+        self.metrics.increment(comicName, "retries")
+        if isinstance(error, StalePageError):
+            # The browser is fine, the page was only slow to replace the last one; load it again
+            return downloader
+        self.releaseDownloader(downloader, broken=True)
+        if isinstance(downloader, WebComicDownloader):
+            self.metrics.increment(comicName, "driver_restarts")
+        return self.createDownloader(engine, profile)
+
+    def renewDownloader(self, comicName: str, downloader: 'WebComicDownloader | HttpComicDownloader') -> 'WebComicDownloader | HttpComicDownloader':
+        """Between pages: swap a browser that reached its page or memory budget, and
+        recycle every browser once the whole process tree is over memory_budget_mb."""
+        if self._governor is not None:
+            usage = self._governor.check()
+            if usage is not None:
+                self.log(comicName, self._governor.describe(*usage))
+                self.metrics.increment(comicName, "memory_restarts")
+                self._governor.reset()
+                if self._driverPool is not None:
+                    self._driverPool.recycleAll()
+
+        if not isinstance(downloader, WebComicDownloader):
+            return downloader
+        renewed = self.getDriverPool().renew(downloader)
+        if renewed is not downloader:
+            self.metrics.increment(comicName, "driver_restarts")
+        return renewed
+
+    def getDriverPool(self) -> WebDriverPool:
+        # Created on first use so runs with only HTTP-engine comics never start a browser
+        with self._driverPoolLock:
+            if self._driverPool is None:
+                maxRSS = self.config.get('driver_max_rss_mb')
+                self._driverPool = WebDriverPool(
+                    self.config.get('browser') or "firefox",
+                    pageLoadStrategy=self.config.get('page_load_strategy') or "normal",
+                    spares=int(self.config.get('driver_spares') or 0),
+                    maxPages=int(self.config.get('driver_max_pages') or 0),
+                    maxRSS=int(maxRSS) * 1024 * 1024 if maxRSS else None,
+                    memoryInterval=float(self.config.get('memory_check_interval') or 10)
+                )
+            return self._driverPool
+
+    def log(self, comicName: str, message: str) -> None:
+        # Workers share stdout; prefix lines so interleaved output stays readable
+        if self._parallel:
+            body = message.lstrip('\n')
+            message = f"{message[:len(message) - len(body)]}[{comicName}] {body}"
+        with self._printLock:
+            print(message)
+
+    def getHost(self, url: str) -> str:
+        return (urlsplit(url).hostname or "").lower()
+
+    def sortedComics(self) -> list[dict]:
+        comics: list[dict] = self.config.get('comics') or []
         download_by = self.config.get('download_by')
-        overwrite_existing: bool = self.config.get('overwrite_existing') == True
-        update_config: bool = self.config.get('update_config') == True
 
         if download_by == "name_desc":
             comics = sorted(comics, key=lambda comic: comic['name'])
         elif download_by == "name_asc":
             comics = sorted(comics, key=lambda comic: comic['name'], reverse=True)
 
-        for i in range(0, len(comics)):
-            comicName = comics[i]['name']
-            currentPage = nextPage = comics[i]['url']
-            pageNum = comics[i]['page_num']
-            enabled = comics[i]['enabled']
+        return comics
+
+    def downloadComics(self, update: bool = False) -> None:
+        """Crawl every enabled comic.
+
+        In update mode each comic starts from its last recorded page, only new
+        pages are fetched, config progress is written once per comic and the
+        number of new pages is reported at the end.
+        """
+        if not self.config.get('comics'):
+            print("No comics to download")
+            exit()
+
+        comics = self.sortedComics()
+        self._comics = comics
+        self._update = update
+
+        maxWorkers = max(1, int(self.config.get('max_workers') or 1))
+        maxPerHost = max(1, int(self.config.get('max_per_host') or 1))
+
+        self._openRun()
+        try:
+            if maxWorkers == 1 or len(comics) == 1:
+                self._parallel = False
+                for comic in comics:
+                    self.downloadComicSafely(comic)
+            else:
+                self._parallel = True
+                try:
+                    self._runWorkers(comics, min(maxWorkers, len(comics)), maxPerHost)
+                finally:
+                    self._parallel = False
+        finally:
+            self._closeRun()
+
+        if update:
+            self.reportNewPages()
+
+        if self.bytesSaved:
+            self.reportBytesSaved()
+
+        self.reportFailures()
+
+    def _openRun(self) -> None:
+        """Reset the run's counters and open everything shared by its comics."""
+        self.newPages = {}
+        self.failures = {}
+        self.bytesSaved = {}
+        self.filesLinked = {}
+        # Listings from an earlier run may be stale, and would otherwise grow forever in a long-lived process
+        with self._filesLock:
+            self._existingFiles = {}
+
+        budget = int(self.config.get('memory_budget_mb') or 0)
+        self._governor = MemoryGovernor(
+            budget=budget * 1024 * 1024 if budget else None,
+            interval=float(self.config.get('memory_check_interval') or 10)
+        )
+        self.metrics = Metrics(governor=self._governor)
+        self._rateLimiter = RateLimiter(
+            initialRate=float(self.config.get('rate_initial') or 2.0),
+            minRate=float(self.config.get('rate_min') or 0.2),
+            maxRate=float(self.config.get('rate_max') or 10.0),
+            maxAttempts=int(self.config.get('retry_attempts') or 5),
+            backoff=float(self.config.get('retry_backoff') or 1.0),
+            maxBackoff=float(self.config.get('retry_backoff_max') or 60.0)
+        )
+
+        if self.config.get('http_cache') == True:
+            maxCache = float(self.config.get('http_cache_max_mb') or 256)
+            self._httpCache = HttpCache("comics/.cache", maxBytes=int(maxCache * 1024 * 1024))
+
+        if self.config.get('dedupe') in ("comic", "global"):
+            self._dedupe = DedupeIndex("comics", method=self.config.get('dedupe_link') or "hardlink")
+
+        from fetcher import ImageFetcher
+
+        # One keep-alive connection pool shared by every download worker
+        maxWorkers = max(1, int(self.config.get('max_workers') or 1))
+        downloadWorkers = max(1, int(self.config.get('download_workers') or 1))
+        self._fetcher = ImageFetcher(poolSize=maxWorkers * downloadWorkers, cache=self._httpCache, dedupe=self._dedupe)
+
+        metricsPort = int(self.config.get('metrics_port') or 0)
+        if metricsPort:
+            self._metricsServer = MetricsServer(self.metrics, metricsPort)
+
+    def _closeRun(self) -> None:
+        # Progress batched by updateComic
+        self.config.flush()
+        self._fetcher.close()
+        self._fetcher = None
+        if self._driverPool is not None:
+            self._driverPool.close()
+            self._driverPool = None
+        if self._httpCache is not None:
+            self._httpCache.close()
+            self._httpCache = None
+        if self._dedupe is not None:
+            self._dedupe.close()
+            self._dedupe = None
+        if self._metricsServer is not None:
+            self._metricsServer.close()
+            self._metricsServer = None
+
+        metricsFile = self.config.get('metrics_file')
+        if metricsFile:
+            self.metrics.write(metricsFile)
+
+    def reportFailures(self) -> None:
+        if self.failures:
+            print("\nFailed:")
+            for comicName, error in self.failures.items():
+                print(f"  {comicName}: {error}")
+
+    def reportNewPages(self) -> None:
+        print("\nNew pages:")
+        for comicName, count in self.newPages.items():
+            print(f"  {comicName}: {count}")
+        print(f"  Total: {sum(self.newPages.values())}")
+
+    def reportBytesSaved(self) -> None:
+        print("\nSaved by deduplication:")
+        for comicName, size in self.bytesSaved.items():
+            print(f"  {comicName}: {self.filesLinked[comicName]} files, {size / (1024 * 1024):.2f} MB")
+        print(f"  Total: {sum(self.filesLinked.values())} files, {sum(self.bytesSaved.values()) / (1024 * 1024):.2f} MB")
+
+    SELECTOR_TYPES = ("id", "xpath", "link_text", "plink_text", "name", "tag_name", "class_name", "css_selector")
 
-            if not enabled:
-                print(f"\nSkipped: {comicName}")
+    def validateConfig(self) -> list[str]:
+        """Problems in the configuration that would make a run fail or misbehave, as readable lines."""
+        problems: list[str] = []
+        choices = {
+            'download_by': ("order", "name_desc", "name_asc"),
+            'page_load_strategy': ("normal", "eager", "none"),
+            'dedupe': ("off", "comic", "global"),
+            'dedupe_link': ("hardlink", "reflink"),
+            'pack': PACK_MODES,
+        }
+        for key, allowed in choices.items():
+            value = self.config.get(key)
+            if value not in allowed:
+                problems.append(f"{key}: '{value}' is not one of {', '.join(allowed)}")
+        if self.config.get('pack') in ("count", "chapter") and self.config.get('crawl_state') != True:
+            # Packed pages are only recognised through the crawl state
+            problems.append("pack: needs crawl_state, or packed pages would be downloaded again")
+
+        comics = self.config.get('comics')
+        if not isinstance(comics, list) or not comics:
+            problems.append("comics: no comics configured")
+            return problems
+
+        seen: set[str] = set()
+        for index, comic in enumerate(comics):
+            name = comic.get('name') if isinstance(comic, dict) else None
+            where = f"comics[{index}]" + (f" ({name})" if name else "")
+            if not isinstance(comic, dict):
+                problems.append(f"{where}: not an object")
+                continue
+            if not name:
+                problems.append(f"{where}: missing name")
+            elif name in seen:
+                # Both would write to the same directory and crawl state
+                problems.append(f"{where}: name used by another comic")
+            elif sanitize(name) != name:
+                problems.append(f"{where}: name contains characters not allowed in a directory name")
+            seen.add(name)
+
+            if urlsplit(comic.get('url') or "").scheme not in ("http", "https"):
+                problems.append(f"{where}: url '{comic.get('url')}' is not an http(s) URL")
+            if not isinstance(comic.get('page_num'), int):
+                problems.append(f"{where}: page_num must be a number")
+            if (comic.get('engine') or "selenium") not in ("selenium", "http"):
+                problems.append(f"{where}: engine '{comic.get('engine')}' is not one of selenium, http")
+
+            for problem in validateArchive(comic.get('archive')):
+                problems.append(f"{where}: {problem}")
+            if comic.get('chapter_pattern'):
+                try:
+                    re.compile(comic['chapter_pattern'])
+                except re.error as e:
+                    problems.append(f"{where}: chapter_pattern is not a valid regex: {e}")
+
+            for key in ('image_selector', 'title_selector', 'next_selector'):
+                selector = comic.get(key)
+                if not selector:
+                    if key == 'image_selector':
+                        problems.append(f"{where}: missing image_selector")
+                    continue
+                if not isinstance(selector, list) or len(selector) != 2 or not selector[1]:
+                    problems.append(f"{where}: {key} must be [type, selector]")
+                elif selector[0] not in self.SELECTOR_TYPES:
+                    problems.append(f"{where}: {key} type '{selector[0]}' is not one of {', '.join(self.SELECTOR_TYPES)}")
+
+        return problems
+
+    def listComics(self) -> None:
+        for comic in self.sortedComics():
+            enabled = "enabled " if comic.get('enabled') else "disabled"
+            engine = comic.get('engine') or "selenium"
+            print(f"{enabled}  {comic.get('name')}  [{engine}]  page {comic.get('page_num')}  {comic.get('url')}")
+
+    def openExistingState(self, comicName: str) -> CrawlState | None:
+        """The comic's crawl state, or None if it was never crawled. Never creates one."""
+        directory = f"comics/{comicName}"
+        if not os.path.exists(os.path.join(directory, CrawlState.FILENAME)):
+            return None
+        return CrawlState(directory)
+
+    def showStatus(self) -> None:
+        """Print what the crawl state knows about each comic, without touching the network."""
+        for comic in self.sortedComics():
+            comicName = comic.get('name')
+            state = self.openExistingState(comicName)
+            if state is None:
+                print(f"{comicName}: never crawled")
                 continue
+            with state:
+                pages, images, complete, packed = state.summary()
+                tail = state.lastPage()
+            resume = f", resumes at page {tail[1]}" if tail else ""
+            print(f"{comicName}: {pages} pages ({complete} complete), {images} images ({packed} packed){resume}")
 
-            imageSelector = comics[i].get('image_selector')
-            titleSelector = comics[i].get('title_selector')
-            nextSelector = comics[i].get('next_selector')
 
-            if imageSelector:
-                imageSelector = self.resolveSelectorType(imageSelector)
-            if titleSelector:
-                titleSelector = self.resolveSelectorType(titleSelector)
-            if nextSelector:
-                nextSelector = self.resolveSelectorType(nextSelector)
+    def dryRun(self, update: bool = False) -> None:
+        """Show where each comic would start and what it would need, without loading anything."""
+        for comic in self.sortedComics():
+            comicName = comic.get('name')
+            if not comic.get('enabled'):
+                print(f"{comicName}: skipped (disabled)")
+                continue
+
+            url, pageNum = comic.get('url'), comic.get('page_num')
+            source = "config"
+            if self.config.get('crawl_state') == True and self.config.get('overwrite_existing') != True:
+                state = self.openExistingState(comicName)
+                if state is not None:
+                    with state:
+                        tail = state.lastPage()
+                    if tail and tail[1] > pageNum:
+                        url, pageNum = tail
+                        source = "crawl state"
+
+            engine = comic.get('engine') or "selenium"
+            needs = "a browser" if engine != "http" else "no browser"
+            mode = "check for new pages" if update else "crawl"
+            print(f"{comicName}: would {mode} from page {pageNum} ({source}) with {needs}: {url}")
 
-            print(f"\nDownloading: {comicName}")
+    def createPacker(self, comic: dict, state: CrawlState) -> CbzPacker | None:
+        mode = self.config.get('pack') or "off"
+        if mode == "off":
+            return None
+        comicName = comic['name']
+        return CbzPacker(
+            comicName,
+            f"comics/{comicName}",
+            state,
+            mode=mode,
+            pagesPerVolume=int(self.config.get('pack_pages') or 100),
+            chapterPattern=comic.get('chapter_pattern'),
+            keepFiles=self.config.get('pack_keep_files') == True,
+            log=lambda message: self.log(comicName, message)
+        )
 
-            if not imageSelector:
-                print("Missing image selector")
+    def packComic(self, comic: dict, state: CrawlState) -> int:
+        """Move the comic's finished pages into its CBZ archives, if packing is enabled."""
+        packer = self.createPacker(comic, state)
+        if packer is None:
+            return 0
+        with self.metrics.time(comic['name'], "pack"):
+            packed = packer.pack()
+        if packed:
+            self.metrics.increment(comic['name'], "packed", packed)
+            # The loose files are gone from the directory listing
+            with self._filesLock:
+                self._existingFiles.pop(packer.directory, None)
+        return packed
+
+    def packComics(self) -> None:
+        """Pack what earlier runs saved, without touching the network."""
+        if (self.config.get('pack') or "off") == "off":
+            print("Packing is off; set pack to count or chapter")
+            return
+        for comic in self.sortedComics():
+            state = self.openExistingState(comic.get('name'))
+            if state is None:
                 continue
+            with state:
+                packed = self.packComic(comic, state)
+            print(f"{comic.get('name')}: {packed} images packed")
+
+    def coordinate(self, queue: WorkQueue, update: bool = False, interval: float = 5.0) -> None:
+        """Queue every enabled comic for the workers sharing `queue` and report once they are done."""
+        comics = [comic for comic in self.sortedComics() if comic.get('enabled')]
+        if not comics:
+            print("No comics to download")
+            exit()
+
+        for comic in comics:
+            queue.enqueue("comic", comic['name'], {"comic": comic, "update": update})
+        print(f"Queued: {len(comics)} comics")
+
+        last = None
+        while True:
+            # Workers reclaim expired leases too; this keeps it going while they are all busy
+            queue.reclaim()
+            status = queue.status()
+            # A worker that missed its heartbeats for a whole lease has most likely died
+            alive = sum(1 for _, age in queue.workers() if age < queue.leaseSeconds)
+            if (status, alive) != last:
+                print("Status: " + ", ".join(
+                    f"{kind} {state} {count}" for kind, counts in sorted(status.items()) for state, count in sorted(counts.items())
+                ) + f"; {alive} workers alive")
+                last = (status, alive)
+            if queue.idle():
+                break
+            time.sleep(interval)
+
+        self.newPages = {}
+        self.failures = {}
+        for name, status, result, error in queue.comics():
+            if status == "failed":
+                self.failures[name] = error or "failed"
+            elif result and result.get("new_pages") is not None:
+                self.newPages[name] = result["new_pages"]
+
+        if update:
+            self.reportNewPages()
+
+        self.reportFailures()
+
+    def runWorker(self, queue: WorkQueue) -> None:
+        """Serve `queue` until it is drained.
+
+        Up to max_workers comics are walked at once, each leased to this worker
+        alone, and download_workers threads save images queued by any walker.
+        Leases are kept alive by a heartbeat; a walker whose lease was reclaimed
+        stops, since another worker now owns the comic.
+        """
+        maxWorkers = max(1, int(self.config.get('max_workers') or 1))
+        downloadWorkers = max(1, int(self.config.get('download_workers') or 1))
+        pollInterval = 1.0
+
+        self._comics = self.config.get('comics') or []
+        self._queue = queue
+        self._parallel = True
+        done = threading.Event()
+        walking: dict[int, threading.Event] = {}
+        walkingLock = threading.Lock()
+
+        def heartbeat() -> None:
+            while not done.wait(max(1.0, queue.leaseSeconds / 3)):
+                for taskId in queue.heartbeat():
+                    with walkingLock:
+                        stop = walking.get(taskId)
+                    if stop is not None:
+                        stop.set()
+
+        def walker() -> None:
+            while not done.is_set():
+                task = queue.lease(["comic"])
+                if task is None:
+                    if queue.idle():
+                        return
+                    time.sleep(pollInterval)
+                    continue
+
+                # Prefer this worker's own entry, so progress lands in its config
+                comic = next((c for c in self._comics if c.get('name') == task.key), task.payload["comic"])
+                stop = threading.Event()
+                with walkingLock:
+                    walking[task.id] = stop
+                try:
+                    self._update = task.payload.get("update") == True
+                    self.downloadComic(comic, stop)
+                except Exception as e:
+                    self.log(task.key, f"Failed: {task.key}: {e}")
+                    queue.fail(task, str(e) or type(e).__name__)
+                else:
+                    queue.complete(task, {"new_pages": self.newPages.get(task.key)})
+                finally:
+                    with walkingLock:
+                        walking.pop(task.id, None)
+
+                metricsFile = self.config.get('metrics_file')
+                if metricsFile:
+                    self.metrics.writeComic(metricsFile, task.key)
+
+        def downloader() -> None:
+            while not done.is_set():
+                task = queue.lease(["image"])
+                if task is None:
+                    if queue.idle():
+                        return
+                    time.sleep(pollInterval)
+                    continue
+
+                recorder = RecordedImage()
+                try:
+                    self.saveImage(DownloadJob(**task.payload), recorder)
+                except Exception as e:
+                    queue.fail(task, f"{task.payload.get('url')}: {e}")
+                else:
+                    queue.complete(task, {"record": recorder.record})
+
+        self._openRun()
+        queue.heartbeat()
+        threads = [threading.Thread(target=heartbeat, name="queue-heartbeat", daemon=True)]
+        threads += [threading.Thread(target=walker, name=f"comic-worker-{n}", daemon=True) for n in range(maxWorkers)]
+        threads += [threading.Thread(target=downloader, name=f"download-worker-{n}", daemon=True) for n in range(downloadWorkers)]
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads[1:]:
+                # Join with a timeout so KeyboardInterrupt still reaches the main thread
+                while thread.is_alive():
+                    thread.join(0.5)
+        finally:
+            done.set()
+            with walkingLock:
+                for stop in walking.values():
+                    stop.set()
+            self._closeRun()
+            self._queue = None
+            self._parallel = False
+
+    def _runWorkers(self, comics: list[dict], maxWorkers: int, maxPerHost: int) -> None:
+        """Crawl comics on a pool of threads, never running more than maxPerHost per host."""
+        pending: list[dict] = list(comics)
+        activeHosts: dict[str, int] = {}
+        errors: list[BaseException] = []
+        condition = threading.Condition()
+        stop = threading.Event()
+
+        def nextComic() -> dict | None:
+            with condition:
+                while pending and not stop.is_set():
+                    for index, comic in enumerate(pending):
+                        host = self.getHost(comic.get('url') or "")
+                        if activeHosts.get(host, 0) < maxPerHost:
+                            activeHosts[host] = activeHosts.get(host, 0) + 1
+                            return pending.pop(index)
+                    # Every remaining comic is on a busy host; wait for one to free up
+                    condition.wait()
+                return None
+
+        def release(comic: dict) -> None:
+            with condition:
+                host = self.getHost(comic.get('url') or "")
+                activeHosts[host] -= 1
+                condition.notify_all()
+
+        def worker() -> None:
+            while True:
+                comic = nextComic()
+                if comic is None:
+                    return
+                try:
+                    self.downloadComicSafely(comic, stop)
+                except BaseException as e:
+                    with condition:
+                        errors.append(e)
+                        stop.set()
+                        condition.notify_all()
+                finally:
+                    release(comic)
 
-            downloader = WebComicDownloader()
+        threads = [threading.Thread(target=worker, name=f"comic-worker-{n}", daemon=True) for n in range(maxWorkers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                # Join with a timeout so KeyboardInterrupt still reaches the main thread
+                while thread.is_alive():
+                    thread.join(0.5)
+        except KeyboardInterrupt:
+            with condition:
+                stop.set()
+                condition.notify_all()
+            raise
+
+        if errors:
+            raise errors[0]
+
+    def downloadComicSafely(self, comic: dict, stop: threading.Event | None = None) -> None:
+        """Crawl one comic; a failure that outlived its retries is reported and the run moves on."""
+        try:
+            self.downloadComic(comic, stop)
+        except Exception as e:
+            with self.config.lock:
+                self.failures[comic['name']] = str(e) or type(e).__name__
+            self.log(comic['name'], f"Failed: {comic['name']}: {e}")
+
+        metricsFile = self.config.get('metrics_file')
+        if metricsFile:
+            self.metrics.writeComic(metricsFile, comic['name'])
+
+    def downloadComic(self, comic: dict, stop: threading.Event | None = None) -> None:
+        comicName = comic['name']
+        currentPage = nextPage = comic['url']
+        pageNum = comic['page_num']
+        enabled = comic['enabled']
+
+        if not enabled:
+            self.log(comicName, f"\nSkipped: {comicName}")
+            return
+
+        delay = self.config.get('delay') or 0.25
+        overwrite_existing: bool = self.config.get('overwrite_existing') == True
+        update_config: bool = self.config.get('update_config') == True
+        crawl_state: bool = self.config.get('crawl_state') == True
+        download_workers = max(1, int(self.config.get('download_workers') or 1))
+        download_queue_size = max(1, int(self.config.get('download_queue_size') or 1))
+
+        imageSelector = comic.get('image_selector')
+        titleSelector = comic.get('title_selector')
+        nextSelector = comic.get('next_selector')
+        engine = comic.get('engine') or "selenium"
+        readyTimeout = float(comic.get('ready_timeout') or 0)
+        scrollToBottom: bool = comic.get('scroll_to_bottom') == True
+        blankFirst: bool = comic.get('blank_first') == True
+        profile = self.getBrowserProfile(comic)
+
+        if imageSelector:
+            imageSelector = self.resolveSelectorType(imageSelector)
+        if titleSelector:
+            titleSelector = self.resolveSelectorType(titleSelector)
+        if nextSelector:
+            nextSelector = self.resolveSelectorType(nextSelector)
+
+        self.log(comicName, f"\nDownloading: {comicName}")
+
+        if not imageSelector:
+            self.log(comicName, "Missing image selector")
+            return
+
+        directory = f"comics/{comicName}"
+        os.makedirs(directory, exist_ok=True)
+
+        # Skip and resume decisions come from the index unless everything is being re-fetched
+        state = CrawlState(directory) if crawl_state else None
+        useState = state is not None and not overwrite_existing
+        newPages = 0
+        lastPage: tuple[str, int] | None = None
+
+        if useState:
+            # Jump straight to the furthest page whose images were all saved
+            tail = state.lastPage()
+            if tail and tail[1] > pageNum:
+                currentPage = nextPage = tail[0]
+                pageNum = tail[1]
+                self.log(comicName, f"Resuming at page {pageNum}")
+
+        def saveProgress(progress: tuple[str, int]) -> None:
+            # Only called once every image of the page (and those before it) is on disk
+            with self.config.lock:
+                self.config.updateComic(comicName, url=progress[0], page_num=progress[1])
+                # Usually the same dict as the config's; a worker's queued copy needs it too
+                comic['url'], comic['page_num'] = progress
+
+        startPage = nextPage
+
+        # Update mode writes progress once, after the last new page is saved
+        onCheckpoint = saveProgress if update_config and not self._update else None
+
+        def recordResult(job: DownloadJob, record: list | None) -> None:
+            if state is not None and record:
+                state.recordImage(*record)
+
+        if self._queue is not None:
+            # Any worker sharing the queue may download this comic's images
+            pipeline = QueuePipeline(
+                self._queue,
+                comicName,
+                recordResult,
+                queueSize=download_queue_size,
+                onCheckpoint=onCheckpoint,
+                skip=lambda job: self.isSaved(job, state)
+            )
+        else:
+            pipeline = DownloadPipeline(
+                lambda job: self.saveImage(job, state),
+                workers=download_workers,
+                queueSize=download_queue_size,
+                onCheckpoint=onCheckpoint
+            )
+        downloader = None
+
+        def renderPage(downloader: Any, url: str) -> PageData:
+            with self.metrics.time(comicName, "load"):
+                downloader.load(url, scroll=scrollToBottom, blankFirst=blankFirst)
+
+            with self.metrics.time(comicName, "ready"):
+                if readyTimeout:
+                    # Wait only as long as it takes the comic image to get a real src
+                    downloader.waitUntilReady(imageSelector, readyTimeout)
+                elif delay:
+                    downloader.wait(delay)
+
+            with self.metrics.time(comicName, "extract"):
+                return downloader.extract(imageSelector, titleSelector, nextSelector)
+
+        def submitImages(pageURL: str, pageNum: int, title: str | None, urls: list[str], referer: str, userAgent: str | None) -> None:
+            # Hand each image to the download workers; blocks while the queue is full
+            urlCount: int = len(urls)
+            for x in range(urlCount):
+                pageNumStr = f"{pageNum:05d}"
+                if urlCount > 1:
+                    pageNumStr += f".{x + 1}"
+
+                if not title:
+                    filename = pageNumStr
+                else:
+                    filename = f"{pageNumStr} - {title}"
+
+                pipeline.submit(DownloadJob(comicName, pageURL, x, urls[x], directory, filename, referer, userAgent))
+
+        try:
+            archive = comic.get('archive')
+            if archive and not self._update:
+                # Fetch every listed page in parallel; the walk below then carries on from the last one
+                listed = self._rateLimiter.call(archive.get('url') or "", lambda: discoverPages(archive, self.resolveSelectorType))
+                firstNum = int(archive.get('first_page') or 1)
+                self.log(comicName, f"Archive lists {len(listed)} pages")
+
+                backfill: list[tuple[str, int, str | None]] = []
+                for index, url in enumerate(listed[:-1]):
+                    number = firstNum + index
+                    if number < pageNum or (useState and state.isComplete(url)):
+                        continue
+                    backfill.append((url, number, listed[index + 1]))
+
+                def backfillPage(url: str, number: int, following: str | None, page: PageData, userAgent: str | None) -> None:
+                    if not page.imageURLs:
+                        self.log(comicName, f"No images: {url}")
+                        return
+                    title = sanitize(page.title) if page.title else None
+                    if state is not None:
+                        # Linked by listing order, so later runs can follow the chain without loading pages
+                        state.recordPage(url, number, title, following, page.imageURLs)
+                    submitImages(url, number, title, page.imageURLs, page.domain, userAgent)
+
+                if backfill:
+                    self.backfillPages(comicName, backfill, renderPage, backfillPage, engine, profile, stop)
+
+                if listed and firstNum + len(listed) - 1 >= pageNum:
+                    currentPage = nextPage = listed[-1]
+                    pageNum = firstNum + len(listed) - 1
+                    if update_config and backfill:
+                        pipeline.checkpoint((listed[-2], pageNum - 1))
 
-            pageCount = 0;
             while nextPage:
-                complete = False
-                urls = None
-                title = None
-                pageCount = pageCount + 1
-
-                # Selenium seems to have a memory leak
-                # restart every 100 pages
-                if pageCount == 100:
-                    pageCount = 0
-                    downloader.close()
-                    downloader = WebComicDownloader()
-
-                while not complete and nextPage:
-                    try:
-                        downloader.load(nextPage)
-
-                        if delay:
-                            downloader.wait(delay)
-
-                        currentPage = nextPage
-                        urls = downloader.getImageURLs(imageSelector)
-
-                        title = None
-                        if titleSelector:
-                            title = downloader.getTitle(titleSelector)
-                            if title:
-                                title = sanitize(title)
-
-                        if nextSelector:
-                            nextPage = downloader.getLink(nextSelector)
-
-                        complete = True
-                    except KeyboardInterrupt as e:
-                        raise e
-                    except:
-                        downloader.close()
-                        downloader = WebComicDownloader()
-
-                if not urls:
+                if stop is not None and stop.is_set():
                     break
 
-                # Loop through and save each image returned
-                urlCount: int = len(urls)
-                for x in range(urlCount):
-                    url = urls[x]
+                # Stop walking as soon as a download fails
+                pipeline.raiseIfFailed()
 
-                    schema = url.split(':')[0]
-                    contentType = None
-                    content = None
-                    needsGet = False
+                known = state.getPage(nextPage) if useState else None
+                if known and known['next_url'] and state.isComplete(nextPage):
+                    # Already saved and not the tail; follow the recorded link without loading the page
+                    currentPage = nextPage
+                    pageNum = known['page_num']
+                    nextPage = known['next_url']
+                else:
+                    # Only start a browser once there is a page that has to be rendered
+                    if downloader is None:
+                        downloader = self.createDownloader(engine, profile)
+                    else:
+                        # Selenium leaks memory; swap in a fresh browser once this one hits its budget
+                        downloader = self.renewDownloader(comicName, downloader)
+
+                    def loadPage():
+                        return renderPage(downloader, nextPage)
 
-                    if schema == "data": # data:image/jpeg;base64,/9j/4TbYRXhpZgAATU0AKgAAAAgADQEA
-                        data = url[5:].split(';')
+                    def replaceDownloader(error: BaseException, attempt: int) -> None:
+                        nonlocal downloader
+                        downloader = self.replaceDownloader(comicName, downloader, nextPage, error, attempt, engine, profile)
 
-                        contentType = data[0]
-                        data = data[1].split(',')
+                    page = self._rateLimiter.call(nextPage, loadPage, onRetry=replaceDownloader)
+                    self.metrics.increment(comicName, "pages")
 
-                        if data[0] == "base64":
-                            content = base64.b64decode(data[1])
+                    currentPage = nextPage
+                    urls = page.imageURLs
 
-                    elif schema == "http" or schema == "https":
-                        response = requests.head(url, headers={
-                            "User-Agent": downloader.userAgent,
-                            "Referer": downloader.getDomain()
-                            })
-                        response.raise_for_status()
-                        contentType = response.headers['content-type']
-                        needsGet = True
+                    title = None
+                    if page.title:
+                        title = sanitize(page.title)
 
-                    if not contentType:
+                    if nextSelector:
+                        nextPage = page.nextURL
+
+                    if not urls:
                         break
 
-                    fileType = mimetypes.guess_extension(contentType)
-                    if not fileType:
-                        fileType = f".{fallbackExension}"
+                    if nextPage:
+                        nextPage = nextPage.strip().split('#')[0] # Get rid of #something-here
 
-                    if not os.path.exists(f"comics/{comicName}"):
-                        os.mkdir(f"comics/{comicName}")
+                    if state is None:
+                        # Without an index, everything after the starting page is new
+                        if currentPage != startPage:
+                            newPages += 1
+                    elif state.getPage(currentPage) is None:
+                        newPages += 1
 
-                    pageNumStr = f"{pageNum:05d}"
-                    if urlCount > 1:
-                        pageNumStr += f".{x + 1}"
+                    if state is not None:
+                        state.recordPage(currentPage, pageNum, title, nextPage if nextPage != currentPage else None, urls)
 
-                    if not title:
-                        filename = f"{pageNumStr}{fileType}"
-                    else:
-                        filename = f"{pageNumStr} - {title}{fileType}"
+                    submitImages(currentPage, pageNum, title, urls, page.domain, downloader.userAgent)
 
-                    exists = os.path.exists(f"comics/{comicName}/{filename}")
+                    lastPage = (currentPage, pageNum)
 
-                    if not overwrite_existing and exists:
-                        print(f"Skipped: {filename}")
-                    else:
-                        if needsGet:
-                            response = requests.get(url, headers={
-                                "User-Agent": downloader.userAgent,
-                                "Referer": downloader.getDomain()
-                                })
-                            response.raise_for_status()
-                            content = response.content
-
-                        if not content:
-                            break
-                        
-                        if exists:
-                            print(f"Overwriting: {filename}")
-                        else:
-                            print(f"Saving: {filename}")
-
-                        with open(f"comics/{comicName}/{filename}", 'wb') as file:
-                            file.write(content)
-
-                # Update config
-                if update_config:
-                    comics[i]['url'] = currentPage
-                    comics[i]['page_num'] = pageNum
-                    self.config.set('comics', comics)
-                    self.config.save()
-
-                if nextPage:
-                    nextPage = nextPage.strip().split('#')[0] # Get rid of #something-here
+                    # Update config
+                    if update_config and not self._update:
+                        pipeline.checkpoint((currentPage, pageNum))
 
                 if not nextPage or nextPage == currentPage:
                     nextPage = None
                 else:
                     pageNum = pageNum + 1
+        except BaseException:
+            pipeline.abort()
+            raise
+        else:
+            pipeline.close()
 
-            downloader.close()
+            if state is not None:
+                self.packComic(comic, state)
+
+            if self._update:
+                if update_config and lastPage is not None:
+                    saveProgress(lastPage)
+                with self.config.lock:
+                    self.newPages[comicName] = newPages
+                self.log(comicName, f"New pages: {newPages}")
+        finally:
+            if downloader is not None:
+                self.releaseDownloader(downloader)
+            if state is not None:
+                state.close()
+
+    def backfillPages(self,
+        comicName: str,
+        pages: list[tuple[str, int, str | None]],
+        render: Callable[[Any, str], PageData],
+        onPage: Callable[[str, int, str | None, PageData, str | None], None],
+        engine: str,
+        profile: BrowserProfile,
+        stop: threading.Event | None = None,
+        ) -> None:
+        """Load and extract (url, page_num, next url) pages on archive_workers threads, each with its own downloader.
+
+        Every host is still held to its rate limit. The first page that fails
+        after its retries stops the backfill and is raised.
+        """
+        remaining = list(reversed(pages))
+        errors: list[BaseException] = []
+        lock = threading.Lock()
+        workers = min(len(pages), max(1, int(self.config.get('archive_workers') or 1)))
+
+        def worker() -> None:
+            downloader = None
+            try:
+                while True:
+                    with lock:
+                        if errors or not remaining or (stop is not None and stop.is_set()):
+                            return
+                        url, number, following = remaining.pop()
+
+                    if downloader is None:
+                        downloader = self.createDownloader(engine, profile)
+                    else:
+                        downloader = self.renewDownloader(comicName, downloader)
+
+                    def replaceDownloader(error: BaseException, attempt: int) -> None:
+                        nonlocal downloader
+                        downloader = self.replaceDownloader(comicName, downloader, url, error, attempt, engine, profile)
+
+                    page = self._rateLimiter.call(url, lambda: render(downloader, url), onRetry=replaceDownloader)
+                    self.metrics.increment(comicName, "pages")
+                    onPage(url, number, following, page, downloader.userAgent)
+            except BaseException as e:
+                with lock:
+                    errors.append(e)
+            finally:
+                if downloader is not None:
+                    self.releaseDownloader(downloader)
+
+        threads = [threading.Thread(target=worker, name=f"archive-worker-{n}", daemon=True) for n in range(workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        if errors:
+            raise errors[0]
+
+    def findExisting(self, directory: str, stem: str) -> str | None:
+        """Return the saved file for `stem` in `directory`, whatever its extension turned out to be."""
+        with self._filesLock:
+            files = self._existingFiles.get(directory)
+            if files is None:
+                # List the directory once instead of probing the disk per image
+                files = {}
+                if os.path.isdir(directory):
+                    for name in os.listdir(directory):
+                        if not name.startswith('.'):
+                            files[os.path.splitext(name)[0]] = name
+                self._existingFiles[directory] = files
+            return files.get(stem)
+
+    def _recordExisting(self, directory: str, stem: str, filename: str) -> None:
+        with self._filesLock:
+            self._existingFiles.setdefault(directory, {})[stem] = filename
+
+    def isSaved(self, job: DownloadJob, state: CrawlState | RecordedImage | None) -> bool:
+        """True (and logged as skipped) when the index says this exact image is already saved."""
+        if state is None or self.config.get('overwrite_existing') == True:
+            return False
+        # Keyed by page and position, so a retitled page is still recognised
+        known = state.getImage(job.page, job.position)
+        if known and known['url'] == job.url:
+            self.metrics.increment(job.comicName, "skipped")
+            self.log(job.comicName, f"Skipped: {known['filename']}")
+            return True
+        return False
+
+    def saveImage(self, job: DownloadJob, state: CrawlState | RecordedImage | None = None) -> None:
+        fallbackExension = self.config.get('fallback_extension') or "png"
+        overwrite_existing: bool = self.config.get('overwrite_existing') == True
+        # Per-comic deduplication only links within the comic's own files
+        dedupeScope = job.comicName if self.config.get('dedupe') == "comic" else ""
+
+        if self.isSaved(job, state):
+            return
+
+        # Skip before touching the network; the extension is only known from the response
+        existing = self.findExisting(job.directory, job.filename)
+        if not overwrite_existing and existing:
+            if state is not None:
+                state.recordImage(job.page, job.position, job.url, existing)
+            self.metrics.increment(job.comicName, "skipped")
+            self.log(job.comicName, f"Skipped: {existing}")
+            return
+
+        url = job.url
+        schema = url.split(':')[0]
+        saved = None
+
+        if schema == "data": # data:image/jpeg;base64,/9j/4TbYRXhpZgAATU0AKgAAAAgADQEA
+            data = url[5:].split(';')
+
+            contentType = data[0]
+            data = data[1].split(',')
+
+            if data[0] == "base64":
+                with self.metrics.time(job.comicName, "save"):
+                    saved = self._fetcher.save(base64.b64decode(data[1]), contentType, job.directory, job.filename, fallbackExension, dedupeScope)
+
+        elif schema == "http" or schema == "https":
+            def download():
+                with self.metrics.time(job.comicName, "download"):
+                    # Re-fetching a file we already have; let the server answer 304 if it is unchanged
+                    return self._fetcher.download(url, job.directory, job.filename, fallbackExension, headers={
+                        "User-Agent": job.userAgent,
+                        "Referer": job.referer
+                        }, conditional=existing is not None, dedupeScope=dedupeScope)
+
+            saved = self._rateLimiter.call(url, download,
+                onRetry=lambda error, attempt: self.metrics.increment(job.comicName, "retries"))
+
+        if not saved:
+            return
+
+        if saved.notModified:
+            if state is not None:
+                state.recordImage(job.page, job.position, job.url, existing)
+            self.metrics.increment(job.comicName, "unchanged")
+            self.log(job.comicName, f"Unchanged: {existing}")
+            return
+
+        filename = saved.filename
+
+        if existing:
+            if existing != filename:
+                # The format changed; drop the copy with the old extension
+                os.remove(f"{job.directory}/{existing}")
+            self.log(job.comicName, f"Overwriting: {filename}")
+        elif saved.deduplicated:
+            self.log(job.comicName, f"Linking: {filename}")
+        else:
+            self.log(job.comicName, f"Saving: {filename}")
+
+        self.metrics.increment(job.comicName, "images")
+        if saved.deduplicated:
+            self.metrics.increment(job.comicName, "linked")
+        else:
+            self.metrics.increment(job.comicName, "bytes", saved.size)
+
+        if saved.deduplicated:
+            with self._filesLock:
+                self.bytesSaved[job.comicName] = self.bytesSaved.get(job.comicName, 0) + saved.size
+                self.filesLinked[job.comicName] = self.filesLinked.get(job.comicName, 0) + 1
+
+        self._recordExisting(job.directory, job.filename, filename)
+
+        if state is not None:
+            state.recordImage(job.page, job.position, job.url, filename, saved.size, saved.sha256, saved.etag, saved.lastModified)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Download web comics page by page.")
+    parser.add_argument("mode", nargs="?", default="download",
+        choices=["download", "update", "coordinate", "worker", "validate", "list", "status", "dry-run", "pack"],
+        help="'download' crawls every comic from its configured page; 'update' only checks for new pages after the last recorded one; "
+            "'coordinate' queues the comics for workers and waits for them; 'worker' crawls and downloads from the queue until it is empty; "
+            "'validate', 'list', 'status' and 'dry-run' only read the config and crawl state; "
+            "'pack' moves already saved pages into CBZ archives")
+    parser.add_argument("--update", action="store_true", help="with 'coordinate' or 'dry-run', only check for new pages")
+    parser.add_argument("--queue", default="comics/.queue.sqlite", help="work queue shared by the coordinator and workers")
+    parser.add_argument("--worker-id", help="name this worker in the queue (default: hostname-pid)")
+    args = parser.parse_args()
+
     try:
         config = Config('config.json')
+        app = Application(config)
+
+        if args.mode == "validate":
+            problems = app.validateConfig()
+            for problem in problems:
+                print(problem)
+            print(f"{len(problems)} problems found" if problems else "Configuration is valid")
+            exit(1 if problems else 0)
+        elif args.mode == "list":
+            app.listComics()
+            exit(0)
+        elif args.mode == "status":
+            app.showStatus()
+            exit(0)
+        elif args.mode == "dry-run":
+            app.dryRun(update=args.update)
+            exit(0)
+        elif args.mode == "pack":
+            app.packComics()
+            exit(0)
 
         if not os.path.exists('comics'):
             os.mkdir('comics')
 
-        app = Application(config)
-        app.downloadComics()
+        if args.mode in ("coordinate", "worker"):
+            with WorkQueue(args.queue, workerId=args.worker_id,
+                leaseSeconds=float(config.get('queue_lease_seconds') or 60),
+                maxAttempts=int(config.get('queue_max_attempts') or 3)) as queue:
+                if args.mode == "coordinate":
+                    app.coordinate(queue, update=args.update)
+                else:
+                    app.runWorker(queue)
+        else:
+            app.downloadComics(update=args.mode == "update")
         print("\nComplete")
     except KeyboardInterrupt:
         print("\nAborted")
@@ -0,0 +1,136 @@
+import os
+import time
+import threading
+from typing import Optional
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+def processRSS(pid: int) -> Optional[int]:
+    """Resident set size of a single process in bytes, or None where /proc is unavailable."""
+    try:
+        with open(f"/proc/{pid}/statm") as file:
+            return int(file.read().split()[1]) * _PAGE_SIZE
+    except (OSError, ValueError, IndexError):
+        return None
+
+def childProcesses(pid: int) -> list[int]:
+    """Every descendant of `pid` (e.g. the Firefox processes started by geckodriver)."""
+    children: dict[int, list[int]] = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return []
+
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as file:
+                # The command name may contain spaces; fields resume after its closing paren
+                fields = file.read().rsplit(')', 1)[1].split()
+            children.setdefault(int(fields[1]), []).append(int(entry))
+        except (OSError, ValueError, IndexError):
+            continue
+
+    found: list[int] = []
+    stack = list(children.get(pid, []))
+    while stack:
+        child = stack.pop()
+        found.append(child)
+        stack.extend(children.get(child, []))
+    return found
+
+def processTreeRSS(pid: int) -> Optional[int]:
+    """Combined resident set size of `pid` and all of its descendants in bytes."""
+    total = processRSS(pid)
+    if total is None:
+        return None
+    for child in childProcesses(pid):
+        total += processRSS(child) or 0
+    return total
+
+class MemoryGovernor:
+    """Keeps a long run within a memory budget for this process and the browsers it started.
+
+    Growth of this process is attributed to the phase that was running when it
+    happened (Metrics.time reports each one), so a leak can be traced to
+    loading, extraction or downloading. check() samples the whole process tree
+    at most every `interval` seconds and returns the usage once it is over
+    `budget` bytes; the caller then recycles its browsers. Phases overlap on
+    different threads, so attribution is approximate.
+    """
+
+    def __init__(self, budget: Optional[int] = None, interval: float = 10.0) -> None:
+        self.budget = budget
+        self.interval = interval
+        self.pid = os.getpid()
+        self.peak: int = 0
+        self.restarts: int = 0
+        self._lock = threading.Lock()
+        self._growth: dict[str, int] = {}
+        self._lastCheck = time.monotonic()
+        self._lastUsage: tuple[int, int] = (processRSS(self.pid) or 0, 0)
+
+    def sample(self) -> Optional[int]:
+        """This process's resident memory in bytes; cheap enough to call around every phase."""
+        return processRSS(self.pid)
+
+    def observe(self, phase: str, growth: int) -> None:
+        with self._lock:
+            self._growth[phase] = self._growth.get(phase, 0) + growth
+
+    def growth(self) -> dict[str, int]:
+        """Net growth of this process per phase since the last restart, largest first."""
+        with self._lock:
+            return dict(sorted(self._growth.items(), key=lambda item: item[1], reverse=True))
+
+    def usage(self) -> tuple[int, int]:
+        """(this process, this process and its children) in bytes."""
+        own = processRSS(self.pid) or 0
+        tree = processTreeRSS(self.pid) or own
+        with self._lock:
+            self.peak = max(self.peak, tree)
+            self._lastUsage = (own, tree)
+        return own, tree
+
+    def check(self) -> Optional[tuple[int, int]]:
+        """(own, tree) usage when the budget is exceeded and a restart is due, otherwise None.
+
+        Only one caller per interval gets the answer, so concurrent walkers do
+        not all restart for the same overshoot.
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._lastCheck < self.interval:
+                return None
+            self._lastCheck = now
+        own, tree = self.usage()
+        if not self.budget or tree <= self.budget:
+            return None
+        with self._lock:
+            self.restarts += 1
+        return own, tree
+
+    def describe(self, own: int, tree: int) -> str:
+        """One line saying where the memory went, for the log."""
+        megabytes = lambda value: f"{value / (1024 * 1024):.1f} MB"
+        growth = [(phase, value) for phase, value in self.growth().items() if value > 0]
+        grew = f"; this process grew most during {growth[0][0]} (+{megabytes(growth[0][1])})" if growth else ""
+        where = "over budget on its own, so recycling browsers will not help" if self.budget and own > self.budget else f"browsers {megabytes(tree - own)}"
+        return f"Memory budget exceeded: {megabytes(tree)} of {megabytes(self.budget or 0)} (this process {megabytes(own)}, {where}){grew}"
+
+    def reset(self) -> None:
+        """Start attributing growth afresh, after the browsers were recycled."""
+        with self._lock:
+            self._growth.clear()
+
+    def snapshot(self) -> dict[str, object]:
+        with self._lock:
+            own, tree = self._lastUsage
+            return {
+                "rss_bytes": own,
+                "tree_rss_bytes": tree,
+                "peak_tree_rss_bytes": self.peak,
+                "restarts": self.restarts,
+                "growth_bytes": dict(self._growth),
+            }
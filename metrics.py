@@ -0,0 +1,211 @@
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+from memory import MemoryGovernor
+
+class Histogram:
+    """Duration samples for one phase. Count, sum and max are exact; percentiles
+    come from a fixed-size reservoir so memory stays flat on long runs."""
+
+    RESERVOIR = 4096
+
+    def __init__(self) -> None:
+        self.count: int = 0
+        self.sum: float = 0.0
+        self.max: float = 0.0
+        self._samples: list[float] = []
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+        if len(self._samples) < self.RESERVOIR:
+            self._samples.append(value)
+        else:
+            index = random.randrange(self.count)
+            if index < self.RESERVOIR:
+                self._samples[index] = value
+
+    def percentile(self, fraction: float) -> float:
+        if not self._samples:
+            return 0.0
+        ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": round(self.sum, 6),
+            "p50": round(self.percentile(0.50), 6),
+            "p95": round(self.percentile(0.95), 6),
+            "max": round(self.max, 6),
+        }
+
+class Metrics:
+    """Per-comic phase timings and counters, shared by every crawl and download thread.
+
+    Phases: load (navigation), ready (waiting for the image), extract, download
+    (HTTP fetch streamed to disk), save (data: URIs) and pack. Counters: pages,
+    images, bytes, skipped, unchanged, linked, packed, retries, driver_restarts and
+    memory_restarts. With a governor, each phase also reports how much this
+    process grew while it ran.
+    """
+
+    def __init__(self, governor: Optional[MemoryGovernor] = None) -> None:
+        self.governor = governor
+        self._lock = threading.Lock()
+        self._phases: dict[str, dict[str, Histogram]] = {}
+        self._counters: dict[str, dict[str, int]] = {}
+        self.started = time.time()
+
+    @contextmanager
+    def time(self, comicName: str, phase: str) -> Iterator[None]:
+        rss = self.governor.sample() if self.governor is not None else None
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(comicName, phase, time.perf_counter() - start)
+            if rss is not None:
+                after = self.governor.sample()
+                if after is not None:
+                    self.governor.observe(phase, after - rss)
+
+    def observe(self, comicName: str, phase: str, seconds: float) -> None:
+        with self._lock:
+            phases = self._phases.setdefault(comicName, {})
+            histogram = phases.get(phase)
+            if histogram is None:
+                histogram = phases[phase] = Histogram()
+            histogram.observe(seconds)
+
+    def increment(self, comicName: str, counter: str, amount: int = 1) -> None:
+        with self._lock:
+            counters = self._counters.setdefault(comicName, {})
+            counters[counter] = counters.get(counter, 0) + amount
+
+    def comicNames(self) -> list[str]:
+        with self._lock:
+            return sorted(set(self._phases) | set(self._counters))
+
+    def comic(self, comicName: str) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "phases": {phase: histogram.summary() for phase, histogram in sorted(self._phases.get(comicName, {}).items())},
+                "counters": dict(sorted(self._counters.get(comicName, {}).items())),
+            }
+
+    def snapshot(self) -> dict[str, Any]:
+        snapshot = {
+            "started": self.started,
+            "elapsed": round(time.time() - self.started, 3),
+            "comics": {comicName: self.comic(comicName) for comicName in self.comicNames()},
+        }
+        if self.governor is not None:
+            snapshot["memory"] = self.governor.snapshot()
+        return snapshot
+
+    def appendRecord(self, path: str, record: dict[str, Any]) -> None:
+        """Append one line to an NDJSON metrics file."""
+        with self._lock:
+            with open(path, 'a') as file:
+                file.write(json.dumps(record) + "\n")
+
+    def writeComic(self, path: str, comicName: str) -> None:
+        """Record a finished comic. Only NDJSON files get a line per comic; JSON is written once at the end."""
+        if path.endswith(".ndjson"):
+            self.appendRecord(path, {"type": "comic", "time": time.time(), "comic": comicName, **self.comic(comicName)})
+
+    def write(self, path: str) -> None:
+        """Write the whole run: a single document for .json, a final summary line for .ndjson."""
+        snapshot = self.snapshot()
+        if path.endswith(".ndjson"):
+            self.appendRecord(path, {"type": "run", "time": time.time(), **snapshot})
+        else:
+            with open(path, 'w') as file:
+                json.dump(snapshot, file, indent=4)
+
+    def prometheus(self) -> str:
+        """The current metrics in the Prometheus text exposition format."""
+        def label(value: str) -> str:
+            return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = [
+            "# HELP comic_phase_seconds Time spent per crawl phase.",
+            "# TYPE comic_phase_seconds summary",
+        ]
+        counterLines: dict[str, list[str]] = {}
+        for comicName in self.comicNames():
+            data = self.comic(comicName)
+            name = label(comicName)
+            for phase, summary in data["phases"].items():
+                labels = f'comic="{name}",phase="{phase}"'
+                lines.append(f'comic_phase_seconds{{{labels},quantile="0.5"}} {summary["p50"]}')
+                lines.append(f'comic_phase_seconds{{{labels},quantile="0.95"}} {summary["p95"]}')
+                lines.append(f'comic_phase_seconds{{{labels},quantile="1"}} {summary["max"]}')
+                lines.append(f'comic_phase_seconds_sum{{{labels}}} {summary["sum"]}')
+                lines.append(f'comic_phase_seconds_count{{{labels}}} {summary["count"]}')
+            for counter, value in data["counters"].items():
+                counterLines.setdefault(counter, []).append(f'comic_{counter}_total{{comic="{name}"}} {value}')
+
+        for counter, values in sorted(counterLines.items()):
+            lines.append(f"# TYPE comic_{counter}_total counter")
+            lines.extend(values)
+
+        if self.governor is not None:
+            memory = self.governor.snapshot()
+            lines.append("# TYPE comic_memory_rss_bytes gauge")
+            lines.append(f'comic_memory_rss_bytes{{process="self"}} {memory["rss_bytes"]}')
+            lines.append(f'comic_memory_rss_bytes{{process="tree"}} {memory["tree_rss_bytes"]}')
+            lines.append("# TYPE comic_memory_growth_bytes gauge")
+            for phase, growth in sorted(memory["growth_bytes"].items()):
+                lines.append(f'comic_memory_growth_bytes{{phase="{label(phase)}"}} {growth}')
+        return "\n".join(lines) + "\n"
+
+class MetricsServer:
+    """Serves Metrics.prometheus() at http://<host>:<port>/metrics for scraping during long runs."""
+
+    def __init__(self, metrics: Metrics, port: int, host: str = "127.0.0.1") -> None:
+        # Only needed when serving, which most runs do not
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        served = metrics
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+            def do_GET(self) -> None:
+                if self.path.split('?')[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = served.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self._server: Optional[Any] = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> 'MetricsServer':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Stop serving. Safe to call more than once."""
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
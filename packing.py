@@ -0,0 +1,180 @@
+import os
+import re
+import zlib
+import zipfile
+from typing import Callable, Optional
+
+from sanitize_filename import sanitize
+
+from state import CrawlState
+
+PACK_MODES = ("off", "count", "chapter")
+
+class CbzPacker:
+    """Moves a comic's finished pages from loose image files into CBZ archives beside them.
+
+    Only the run of complete pages the crawl resumes from is packed, so a page
+    never goes into an archive with images missing. Images are stored as they
+    are (ZIP_STORED) since they are already compressed. Archives grow in place
+    as pages arrive. Before an append, the central directory it overwrites is
+    kept in a journal, so an interrupted pack is rolled back to the archive as
+    it was. Packed images keep their crawl state records, which is what skip
+    and resume go by, so they are not downloaded again once the loose files
+    are gone.
+    """
+
+    def __init__(self,
+        comicName: str,
+        directory: str,
+        state: CrawlState,
+        mode: str = "count",
+        pagesPerVolume: int = 100,
+        chapterPattern: Optional[str] = None,
+        keepFiles: bool = False,
+        log: Optional[Callable[[str], None]] = None,
+        ) -> None:
+        if mode not in PACK_MODES or mode == "off":
+            raise ValueError(f"Unknown pack mode '{mode}', expected count or chapter")
+        self.comicName = comicName
+        self.directory = directory
+        self.state = state
+        self.mode = mode
+        self.pagesPerVolume = max(1, pagesPerVolume)
+        self.chapterPattern = re.compile(chapterPattern) if chapterPattern else None
+        self.keepFiles = keepFiles
+        self.log = log or (lambda message: None)
+
+    def plan(self) -> dict[str, list[tuple[str, int, str]]]:
+        """Archive name -> (page url, position, filename) of each complete image not packed yet, in page order."""
+        volumes: dict[str, list[tuple[str, int, str]]] = {}
+        chapter: Optional[str] = None
+        for url, page in self.state.completePages():
+            if self.mode == "chapter":
+                # A page whose title does not name a chapter belongs to the one before it
+                match = self.chapterPattern.search(page["title"] or "") if self.chapterPattern else None
+                if match:
+                    chapter = match.group(1) if match.groups() else match.group(0)
+                name = f"{self.comicName} - {chapter}" if chapter else self.comicName
+            else:
+                first = (page["page_num"] - 1) // self.pagesPerVolume * self.pagesPerVolume + 1
+                name = f"{self.comicName} {first:05d}-{first + self.pagesPerVolume - 1:05d}"
+
+            for position in range(len(page["image_urls"])):
+                if self.state.getPacked(url, position) is not None:
+                    continue
+                image = self.state.getImage(url, position)
+                volumes.setdefault(sanitize(name) + ".cbz", []).append((url, position, image["filename"]))
+        return volumes
+
+    def pack(self) -> int:
+        """Pack every finished page that is still loose. Returns the number of images packed."""
+        packed = 0
+        for archive, entries in self.plan().items():
+            added = self._append(archive, entries)
+            for url, position, filename in added:
+                self.state.recordPacked(url, position, archive, filename)
+            # The loose files only go once the state knows where their images went
+            self.state.flush()
+            if not self.keepFiles:
+                for url, position, filename in added:
+                    source = os.path.join(self.directory, filename)
+                    if os.path.isfile(source):
+                        os.remove(source)
+            if added:
+                self.log(f"Packed: {len(added)} images into {archive}")
+            packed += len(added)
+        return packed
+
+    def _append(self, archive: str, entries: list[tuple[str, int, str]]) -> list[tuple[str, int, str]]:
+        path = os.path.join(self.directory, archive)
+        journal = os.path.join(self.directory, f".{archive}.journal")
+        if os.path.exists(journal):
+            # An earlier pack was interrupted while appending
+            self._rollBack(path, journal)
+
+        if not os.path.exists(path):
+            # A new volume is written aside and renamed in, so a half-written one never shows up
+            partial = os.path.join(self.directory, f".{archive}.part")
+            try:
+                with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_STORED) as cbz:
+                    added = self._write(cbz, archive, entries)
+                if added:
+                    self._sync(partial)
+                    os.replace(partial, path)
+            finally:
+                if os.path.exists(partial):
+                    os.remove(partial)
+            return added
+
+        try:
+            with zipfile.ZipFile(path, 'a', compression=zipfile.ZIP_STORED) as cbz:
+                # New members overwrite the central directory; keep it to restore if this does not finish
+                self._saveJournal(path, journal, cbz.start_dir)
+                added = self._write(cbz, archive, entries)
+            self._sync(path)
+        except BaseException:
+            self._rollBack(path, journal)
+            raise
+        os.remove(journal)
+        return added
+
+    def _write(self, cbz: zipfile.ZipFile, archive: str, entries: list[tuple[str, int, str]]) -> list[tuple[str, int, str]]:
+        members = {info.filename: info for info in cbz.infolist()}
+        added: list[tuple[str, int, str]] = []
+        for entry in entries:
+            filename = entry[2]
+            source = os.path.join(self.directory, filename)
+            member = members.get(filename)
+            if member is not None:
+                # Packed before an interruption; a zip member cannot be replaced
+                if not os.path.isfile(source) or self._sameFile(source, member):
+                    added.append(entry)
+                else:
+                    self.log(f"Not packed: {filename} differs from the copy in {archive}")
+                continue
+            if not os.path.isfile(source):
+                self.log(f"Not packed: {filename} is missing")
+                continue
+            # Streamed from disk in chunks, never held in memory
+            cbz.write(source, filename)
+            members[filename] = cbz.getinfo(filename)
+            added.append(entry)
+        return added
+
+    def _saveJournal(self, path: str, journal: str, offset: int) -> None:
+        """Record where the members end and the central directory after them, to roll back an append."""
+        with open(path, 'rb') as file:
+            file.seek(offset)
+            tail = file.read()
+        temp = journal + ".part"
+        with open(temp, 'wb') as file:
+            file.write(offset.to_bytes(8, "big") + tail)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp, journal)
+
+    def _rollBack(self, path: str, journal: str) -> None:
+        """Cut off a partial append and put the old central directory back."""
+        with open(journal, 'rb') as file:
+            offset = int.from_bytes(file.read(8), "big")
+            tail = file.read()
+        with open(path, 'r+b') as file:
+            file.truncate(offset)
+            file.seek(offset)
+            file.write(tail)
+            file.flush()
+            os.fsync(file.fileno())
+        os.remove(journal)
+
+    def _sync(self, path: str) -> None:
+        with open(path, 'rb') as file:
+            os.fsync(file.fileno())
+
+    def _sameFile(self, source: str, member: zipfile.ZipInfo) -> bool:
+        if os.path.getsize(source) != member.file_size:
+            return False
+        crc = 0
+        with open(source, 'rb') as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                crc = zlib.crc32(chunk, crc)
+        return crc == member.CRC
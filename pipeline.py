@@ -0,0 +1,147 @@
+import queue
+import threading
+from collections import deque
+from typing import Any, Callable, NamedTuple, Optional
+
+class DownloadJob(NamedTuple):
+    comicName: str
+    page: str
+    position: int # index of the image on its page
+    url: str
+    directory: str
+    filename: str # without extension, it is only known once the response arrives
+    referer: Optional[str]
+    userAgent: Optional[str]
+
+class DownloadPipeline:
+    """Bounded producer/consumer queue that decouples image downloads from page navigation.
+
+    The page walker submits jobs, blocking while the queue is full, and a pool
+    of worker threads hands each job to `handler`. The first failure stops the
+    pipeline: queued jobs are discarded and the next submit raises it.
+
+    Checkpoints let the walker attach a value to everything submitted so far;
+    `onCheckpoint` is called with it, in order, once all of those jobs succeeded.
+    """
+
+    def __init__(self,
+        handler: Callable[[DownloadJob], None],
+        workers: int = 4,
+        queueSize: int = 16,
+        onCheckpoint: Optional[Callable[[Any], None]] = None,
+        ) -> None:
+        self._handler = handler
+        self._onCheckpoint = onCheckpoint
+        self._queue: queue.Queue = queue.Queue(maxsize=max(1, queueSize))
+        self._lock = threading.Lock()
+        self._checkpointLock = threading.Lock()
+        self._failed = threading.Event()
+        self._error: Optional[BaseException] = None
+        self._submitted: int = 0
+        self._pending: set[int] = set()
+        self._checkpoints: deque[tuple[int, Any]] = deque()
+        self._closed: bool = False
+
+        self._threads = [
+            threading.Thread(target=self._work, name=f"download-worker-{n}", daemon=True)
+            for n in range(max(1, workers))
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def __enter__(self) -> 'DownloadPipeline':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        # Do not suppress exceptions
+        return False
+
+    def raiseIfFailed(self) -> None:
+        if self._failed.is_set() and self._error is not None:
+            raise self._error
+
+    def submit(self, job: DownloadJob) -> None:
+        """Queue a job, blocking while the queue is full. Raises the first download failure."""
+        if self._closed:
+            raise RuntimeError("DownloadPipeline is closed.")
+        self.raiseIfFailed()
+
+        with self._lock:
+            seq = self._submitted
+            self._submitted += 1
+            self._pending.add(seq)
+
+        while True:
+            try:
+                self._queue.put((seq, job), timeout=0.25)
+                return
+            except queue.Full:
+                self.raiseIfFailed()
+
+    def checkpoint(self, value: Any) -> None:
+        with self._lock:
+            self._checkpoints.append((self._submitted, value))
+        self._fireCheckpoints()
+
+    def close(self) -> None:
+        """Wait for every queued job to finish, then raise the first failure if there was one."""
+        self._shutdown()
+        self._fireCheckpoints()
+        self.raiseIfFailed()
+
+    def abort(self) -> None:
+        """Discard queued jobs and stop the workers without raising."""
+        with self._lock:
+            if self._error is None:
+                self._error = RuntimeError("DownloadPipeline was aborted.")
+        self._failed.set()
+        self._shutdown()
+
+    def _shutdown(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _work(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+
+            seq, job = item
+            if self._failed.is_set():
+                # Drain without running; the job stays pending so later checkpoints never fire
+                continue
+
+            try:
+                self._handler(job)
+                with self._lock:
+                    self._pending.discard(seq)
+                self._fireCheckpoints()
+            except BaseException as e:
+                with self._lock:
+                    if self._error is None:
+                        self._error = e
+                self._failed.set()
+
+    def _fireCheckpoints(self) -> None:
+        # Serialised so callbacks always run in submission order
+        with self._checkpointLock:
+            while True:
+                with self._lock:
+                    if not self._checkpoints:
+                        return
+                    boundary, value = self._checkpoints[0]
+                    if self._pending and min(self._pending) < boundary:
+                        return
+                    self._checkpoints.popleft()
+                if self._onCheckpoint is not None:
+                    self._onCheckpoint(value)
@@ -0,0 +1,183 @@
+import sys
+import time
+import random
+import threading
+import email.utils
+from datetime import datetime, timezone
+from typing import Callable, Optional, TypeVar
+from urllib.parse import urlsplit
+
+T = TypeVar('T')
+
+# Statuses worth another attempt; 429 and 503 additionally slow the host down
+RETRY_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+THROTTLE_STATUSES = {429, 503}
+
+class TransientError(Exception):
+    """Base for our own errors that another attempt may get past, such as a page that loaded too slowly."""
+
+def parseRetryAfter(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a Retry-After header, given either as seconds or as an HTTP date."""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+class HostBucket:
+    """Token bucket for one host. The refill rate adapts to how the host responds."""
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blockedUntil = 0.0
+
+    def reserve(self, now: float) -> float:
+        """Take a token and return 0, or return how long to wait before trying again."""
+        if now < self.blockedUntil:
+            return self.blockedUntil - now
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+class RateLimiter:
+    """Per-host token buckets with additive increase / multiplicative decrease and retries.
+
+    Every host starts at `initialRate` requests per second. Each success raises
+    the rate by INCREASE up to `maxRate`; a 429 or 503 halves it (down to
+    `minRate`) and pauses the host for its Retry-After. Transient failures
+    (connection errors, timeouts, retryable statuses, browser errors) are
+    retried with exponential backoff and full jitter, at most `maxAttempts`
+    times; anything else is raised on the first attempt.
+    """
+
+    INCREASE = 0.1
+    DECREASE = 0.5
+    BURST = 2.0
+
+    def __init__(self,
+        initialRate: float = 2.0,
+        minRate: float = 0.2,
+        maxRate: float = 10.0,
+        maxAttempts: int = 5,
+        backoff: float = 1.0,
+        maxBackoff: float = 60.0,
+        ) -> None:
+        self.initialRate = initialRate
+        self.minRate = minRate
+        self.maxRate = maxRate
+        self.maxAttempts = max(1, maxAttempts)
+        self.backoff = backoff
+        self.maxBackoff = maxBackoff
+        self._buckets: dict[str, HostBucket] = {}
+        self._lock = threading.Lock()
+
+    def getHost(self, url: str) -> str:
+        return (urlsplit(url).hostname or "").lower()
+
+    def _bucket(self, host: str) -> HostBucket:
+        bucket = self._buckets.get(host)
+        if bucket is None:
+            bucket = self._buckets[host] = HostBucket(self.initialRate, self.BURST)
+        return bucket
+
+    def acquire(self, host: str) -> None:
+        """Block until `host` may be sent another request."""
+        while True:
+            with self._lock:
+                wait = self._bucket(host).reserve(time.monotonic())
+            if wait <= 0:
+                return
+            time.sleep(wait)
+
+    def success(self, host: str) -> None:
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.rate = min(self.maxRate, bucket.rate + self.INCREASE)
+
+    def throttled(self, host: str, retryAfter: Optional[float] = None) -> None:
+        with self._lock:
+            bucket = self._bucket(host)
+            bucket.rate = max(self.minRate, bucket.rate * self.DECREASE)
+            bucket.tokens = 0
+            if retryAfter:
+                bucket.blockedUntil = max(bucket.blockedUntil, time.monotonic() + retryAfter)
+
+    def call(self,
+        url: str,
+        fn: Callable[[], T],
+        onRetry: Optional[Callable[[BaseException, int], None]] = None,
+        ) -> T:
+        """Run `fn` against the host of `url` under its rate limit, retrying transient failures.
+
+        `onRetry(error, attempt)` runs before each retry, e.g. to replace a broken browser.
+        Errors that cannot succeed on retry (404 and other 4xx, bad selectors or URLs,
+        bugs) are raised straight away.
+        """
+        host = self.getHost(url)
+        attempt = 0
+        while True:
+            attempt += 1
+            self.acquire(host)
+            try:
+                result = fn()
+            except Exception as e:
+                retryable, status, retryAfter = self._classify(e)
+                if not retryable:
+                    raise
+                if status in THROTTLE_STATUSES:
+                    self.throttled(host, retryAfter)
+                if attempt >= self.maxAttempts:
+                    raise
+
+                # Full jitter keeps workers that failed together from retrying together
+                delay = random.uniform(0, min(self.maxBackoff, self.backoff * 2 ** (attempt - 1)))
+                if retryAfter is not None:
+                    delay = max(delay, retryAfter)
+                if onRetry is not None:
+                    onRetry(e, attempt)
+                time.sleep(delay)
+                continue
+
+            self.success(host)
+            return result
+
+    def _classify(self, error: BaseException) -> tuple[bool, Optional[int], Optional[float]]:
+        """(worth retrying, HTTP status, Retry-After seconds) for an error raised by a call."""
+        if isinstance(error, TransientError):
+            return True, None, None
+
+        # requests and selenium are only imported by the engines that use them; an
+        # error can only come from a library that is already loaded
+        requests = sys.modules.get('requests')
+        if requests is not None:
+            if isinstance(error, requests.HTTPError):
+                response = error.response
+                if response is None:
+                    return False, None, None
+                status = response.status_code
+                return status in RETRY_STATUSES, status, parseRetryAfter(response.headers.get('retry-after'))
+            if isinstance(error, (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)):
+                return True, None, None
+
+        selenium = sys.modules.get('selenium.common.exceptions')
+        if selenium is not None and isinstance(error, selenium.WebDriverException):
+            # A broken or hung browser; a bad selector or argument fails the same way every time
+            permanent = (selenium.InvalidSelectorException, selenium.InvalidArgumentException)
+            return not isinstance(error, permanent), None, None
+
+        return False, None, None
@@ -0,0 +1,240 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from typing import Any, Optional
+
+class CrawlState:
+    """Per-comic index of crawled pages and saved images, kept in comics/<name>/.state.sqlite.
+
+    Everything is loaded into memory when opened so skip and resume decisions
+    never touch the disk. Writes are buffered and committed in batches, either
+    every FLUSH_PAGES pages or every FLUSH_INTERVAL seconds, and on close.
+    """
+
+    FILENAME = ".state.sqlite"
+    FLUSH_PAGES = 25
+    FLUSH_INTERVAL = 10.0
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS pages (
+            url TEXT PRIMARY KEY,
+            page_num INTEGER NOT NULL,
+            title TEXT,
+            next_url TEXT,
+            image_urls TEXT NOT NULL,
+            crawled_at REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS images (
+            page_url TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            url TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            size INTEGER,
+            sha256 TEXT,
+            etag TEXT,
+            last_modified TEXT,
+            saved_at REAL NOT NULL,
+            PRIMARY KEY (page_url, position)
+        );
+        CREATE TABLE IF NOT EXISTS packed (
+            page_url TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            archive TEXT NOT NULL,
+            member TEXT NOT NULL,
+            packed_at REAL NOT NULL,
+            PRIMARY KEY (page_url, position)
+        );
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.path = os.path.join(directory, self.FILENAME)
+        self._lock = threading.RLock()
+        self._pages: dict[str, dict[str, Any]] = {}
+        self._images: dict[tuple[str, int], dict[str, Any]] = {}
+        self._packed: dict[tuple[str, int], tuple[str, str]] = {}
+        self._pendingPages: list[tuple] = []
+        self._pendingImages: list[tuple] = []
+        self._lastFlush = time.monotonic()
+
+        os.makedirs(directory, exist_ok=True)
+        # Download workers record images while the page walker records pages
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+        self._load()
+
+    def __enter__(self) -> 'CrawlState':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Flush pending writes and close the database. Safe to call more than once."""
+        with self._lock:
+            if self._connection is None:
+                return
+            try:
+                self.flush()
+            finally:
+                self._connection.close()
+                self._connection = None
+
+    def _load(self) -> None:
+        for url, pageNum, title, nextURL, imageURLs in self._connection.execute(
+            "SELECT url, page_num, title, next_url, image_urls FROM pages"):
+            self._pages[url] = {
+                "page_num": pageNum,
+                "title": title,
+                "next_url": nextURL,
+                "image_urls": json.loads(imageURLs),
+            }
+        for pageURL, position, url, filename, size, sha256, etag, lastModified in self._connection.execute(
+            "SELECT page_url, position, url, filename, size, sha256, etag, last_modified FROM images"):
+            self._images[(pageURL, position)] = {
+                "url": url,
+                "filename": filename,
+                "size": size,
+                "sha256": sha256,
+                "etag": etag,
+                "last_modified": lastModified,
+            }
+        for pageURL, position, archive, member in self._connection.execute(
+            "SELECT page_url, position, archive, member FROM packed"):
+            self._packed[(pageURL, position)] = (archive, member)
+
+    def getPage(self, url: str) -> Optional[dict[str, Any]]:
+        with self._lock:
+            return self._pages.get(url)
+
+    def getImage(self, pageURL: str, position: int) -> Optional[dict[str, Any]]:
+        with self._lock:
+            return self._images.get((pageURL, position))
+
+    def getPacked(self, pageURL: str, position: int) -> Optional[tuple[str, str]]:
+        """(archive, member) the image was packed into, or None while it is a loose file."""
+        with self._lock:
+            return self._packed.get((pageURL, position))
+
+    def isComplete(self, url: str) -> bool:
+        """True once every image found on the page has been saved."""
+        with self._lock:
+            page = self._pages.get(url)
+            if not page or not page["image_urls"]:
+                return False
+            return all((url, position) in self._images for position in range(len(page["image_urls"])))
+
+    def summary(self) -> tuple[int, int, int, int]:
+        """(pages crawled, images saved, pages with every image saved, images packed)."""
+        with self._lock:
+            return len(self._pages), len(self._images), sum(1 for url in self._pages if self.isComplete(url)), len(self._packed)
+
+    def completePages(self) -> list[tuple[str, dict[str, Any]]]:
+        """(url, page) of the contiguous run of complete pages lastPage() ends with, in page order."""
+        with self._lock:
+            pages: list[tuple[str, dict[str, Any]]] = []
+            for url, page in sorted(self._pages.items(), key=lambda item: item[1]["page_num"]):
+                if not self.isComplete(url):
+                    break
+                pages.append((url, page))
+            return pages
+
+    def lastPage(self) -> Optional[tuple[str, int]]:
+        """The (url, page_num) of the furthest page with every page before it also fully saved.
+
+        Images are saved out of order, so a failed page can be followed by complete
+        ones; resuming past it would leave it behind for good.
+        """
+        pages = self.completePages()
+        if not pages:
+            return None
+        url, page = pages[-1]
+        return url, page["page_num"]
+
+    def recordPage(self, url: str, pageNum: int, title: Optional[str], nextURL: Optional[str], imageURLs: list[str]) -> None:
+        with self._lock:
+            previous = self._pages.get(url)
+            if previous and previous["image_urls"] != imageURLs:
+                # The page now links different images; forget what was saved for it
+                for position in range(len(previous["image_urls"])):
+                    self._images.pop((url, position), None)
+                    self._packed.pop((url, position), None)
+                self._pendingImages.append(("delete", url))
+
+            self._pages[url] = {
+                "page_num": pageNum,
+                "title": title,
+                "next_url": nextURL,
+                "image_urls": list(imageURLs),
+            }
+            self._pendingPages.append((url, pageNum, title, nextURL, json.dumps(imageURLs), time.time()))
+            self._maybeFlush()
+
+    def recordImage(self,
+        pageURL: str,
+        position: int,
+        url: str,
+        filename: str,
+        size: Optional[int] = None,
+        sha256: Optional[str] = None,
+        etag: Optional[str] = None,
+        lastModified: Optional[str] = None,
+        ) -> None:
+        with self._lock:
+            self._images[(pageURL, position)] = {
+                "url": url,
+                "filename": filename,
+                "size": size,
+                "sha256": sha256,
+                "etag": etag,
+                "last_modified": lastModified,
+            }
+            self._pendingImages.append(("upsert", (pageURL, position, url, filename, size, sha256, etag, lastModified, time.time())))
+            if self._packed.pop((pageURL, position), None) is not None:
+                # Saved again as a loose file (overwrite_existing); it has to be packed again
+                self._pendingImages.append(("unpack", (pageURL, position)))
+            self._maybeFlush()
+
+    def recordPacked(self, pageURL: str, position: int, archive: str, member: str) -> None:
+        with self._lock:
+            self._packed[(pageURL, position)] = (archive, member)
+            self._pendingImages.append(("packed", (pageURL, position, archive, member, time.time())))
+            self._maybeFlush()
+
+    def _maybeFlush(self) -> None:
+        if len(self._pendingPages) >= self.FLUSH_PAGES or time.monotonic() - self._lastFlush >= self.FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit every buffered write in a single transaction."""
+        with self._lock:
+            self._lastFlush = time.monotonic()
+            if self._connection is None or (not self._pendingPages and not self._pendingImages):
+                return
+            with self._connection:
+                self._connection.executemany(
+                    "INSERT OR REPLACE INTO pages (url, page_num, title, next_url, image_urls, crawled_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    self._pendingPages
+                )
+                # Replayed in order so a page reset never deletes images saved after it
+                for action, values in self._pendingImages:
+                    if action == "delete":
+                        self._connection.execute("DELETE FROM images WHERE page_url = ?", (values,))
+                        self._connection.execute("DELETE FROM packed WHERE page_url = ?", (values,))
+                    elif action == "unpack":
+                        self._connection.execute("DELETE FROM packed WHERE page_url = ? AND position = ?", values)
+                    elif action == "packed":
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO packed (page_url, position, archive, member, packed_at) VALUES (?, ?, ?, ?, ?)",
+                            values
+                        )
+                    else:
+                        self._connection.execute(
+                            "INSERT OR REPLACE INTO images (page_url, position, url, filename, size, sha256, etag, last_modified, saved_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                            values
+                        )
+            self._pendingPages.clear()
+            self._pendingImages.clear()
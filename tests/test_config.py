@@ -0,0 +1,101 @@
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from config import Config
+
+class ConfigProgressTest(unittest.TestCase):
+    """Batched comic progress written by updateComic against a temporary config file."""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp(prefix="config-test-")
+        self.path = os.path.join(self.directory, "config.json")
+        self.configs: list[Config] = []
+        config = self.config()
+        config.set('comics', [
+            {"name": "First", "url": "https://example.com/first/1", "page_num": 1},
+            {"name": "Second", "url": "https://example.com/second/1", "page_num": 1},
+        ])
+        config.save()
+
+    def tearDown(self) -> None:
+        # Otherwise the flush registered with atexit finds the directory gone
+        for config in self.configs:
+            config.flush()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def config(self) -> Config:
+        # Only flush() writes progress, unless a test lowers the batch size
+        config = Config(self.path)
+        config.FLUSH_CHANGES = 1000
+        config.FLUSH_INTERVAL = 1000.0
+        self.configs.append(config)
+        return config
+
+    def onDisk(self) -> dict[str, dict]:
+        with open(self.path) as file:
+            return {comic["name"]: comic for comic in json.load(file)["comics"]}
+
+    def testProgressIsBatched(self) -> None:
+        config = self.config()
+        self.assertTrue(config.updateComic("First", url="https://example.com/first/2", page_num=2))
+        self.assertEqual(config.get('comics')[0]["page_num"], 2)
+        self.assertEqual(self.onDisk()["First"]["page_num"], 1)
+
+        config.flush()
+        self.assertEqual(self.onDisk()["First"]["page_num"], 2)
+        self.assertEqual(self.onDisk()["First"]["url"], "https://example.com/first/2")
+
+    def testWrittenAfterFlushChanges(self) -> None:
+        config = self.config()
+        config.FLUSH_CHANGES = 2
+        config.updateComic("First", page_num=2)
+        self.assertEqual(self.onDisk()["First"]["page_num"], 1)
+        config.updateComic("First", page_num=3)
+        self.assertEqual(self.onDisk()["First"]["page_num"], 3)
+
+    def testUnknownComic(self) -> None:
+        config = self.config()
+        self.assertFalse(config.updateComic("Missing", page_num=2))
+        config.flush()
+        self.assertNotIn("Missing", self.onDisk())
+
+    def testFindsComicAfterListIsReordered(self) -> None:
+        config = self.config()
+        config.updateComic("Second", page_num=2)
+        config.set('comics', list(reversed(config.get('comics'))))
+        self.assertTrue(config.updateComic("Second", page_num=3))
+        self.assertEqual(config.get('comics')[0]["name"], "Second")
+        self.assertEqual(config.get('comics')[0]["page_num"], 3)
+
+    def testProcessesMergeTheirProgress(self) -> None:
+        # Two workers sharing the file each only write the comics they changed
+        first, second = self.config(), self.config()
+        first.updateComic("First", page_num=5)
+        second.updateComic("Second", page_num=7)
+        first.flush()
+        second.flush()
+
+        comics = self.onDisk()
+        self.assertEqual(comics["First"]["page_num"], 5)
+        self.assertEqual(comics["Second"]["page_num"], 7)
+
+    def testEditsMadeOnDiskSurviveAFlush(self) -> None:
+        config = self.config()
+        with open(self.path) as file:
+            store = json.load(file)
+        store["delay"] = 2.0
+        with open(self.path, 'w') as file:
+            json.dump(store, file)
+
+        config.updateComic("First", page_num=4)
+        config.flush()
+        with open(self.path) as file:
+            store = json.load(file)
+        self.assertEqual(store["delay"], 2.0)
+        self.assertEqual(store["comics"][0]["page_num"], 4)
+
+if __name__ == "__main__":
+    unittest.main()
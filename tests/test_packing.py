@@ -0,0 +1,109 @@
+import os
+import shutil
+import zipfile
+import tempfile
+import unittest
+
+from packing import CbzPacker
+from state import CrawlState
+
+class InterruptedPacker(CbzPacker):
+    """Fails after writing the first new member, as a crash in the middle of an append would."""
+
+    def _write(self, cbz: zipfile.ZipFile, archive: str, entries: list[tuple[str, int, str]]) -> list[tuple[str, int, str]]:
+        super()._write(cbz, archive, entries[:1])
+        raise KeyboardInterrupt
+
+class CbzPackerTest(unittest.TestCase):
+    """Packing into and appending to archives, and rolling back an append that did not finish."""
+
+    ARCHIVE = "Comic 00001-00010.cbz"
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp(prefix="packing-test-")
+        self.state = CrawlState(self.directory)
+
+    def tearDown(self) -> None:
+        self.state.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def savePages(self, first: int, last: int) -> None:
+        for n in range(first, last + 1):
+            filename = f"{n:05d}.png"
+            with open(os.path.join(self.directory, filename), 'wb') as file:
+                file.write(f"image {n}".encode() * 100)
+            url = f"https://example.com/{n}"
+            self.state.recordPage(url, n, f"Page {n}", f"https://example.com/{n + 1}", [f"{url}.png"])
+            self.state.recordImage(url, 0, f"{url}.png", filename)
+
+    def packer(self, cls: type = CbzPacker) -> CbzPacker:
+        return cls("Comic", self.directory, self.state, mode="count", pagesPerVolume=10)
+
+    def members(self) -> list[str]:
+        with zipfile.ZipFile(os.path.join(self.directory, self.ARCHIVE)) as cbz:
+            self.assertIsNone(cbz.testzip())
+            return cbz.namelist()
+
+    def read(self, name: str) -> bytes:
+        with open(os.path.join(self.directory, name), 'rb') as file:
+            return file.read()
+
+    def testPackMovesImagesIntoVolumes(self) -> None:
+        self.savePages(1, 12)
+        self.assertEqual(self.packer().pack(), 12)
+
+        self.assertEqual(self.members(), [f"{n:05d}.png" for n in range(1, 11)])
+        files = os.listdir(self.directory)
+        self.assertEqual(sorted(name for name in files if name.endswith(".cbz")), [self.ARCHIVE, "Comic 00011-00020.cbz"])
+        self.assertEqual([name for name in files if name.endswith(".png")], [])
+        self.assertEqual(self.state.getPacked("https://example.com/3", 0), (self.ARCHIVE, "00003.png"))
+        self.assertEqual(self.packer().pack(), 0)
+
+    def testPackAppendsToAnExistingVolume(self) -> None:
+        self.savePages(1, 3)
+        self.packer().pack()
+        self.savePages(4, 5)
+        self.assertEqual(self.packer().pack(), 2)
+        self.assertEqual(self.members(), [f"{n:05d}.png" for n in range(1, 6)])
+
+    def testInterruptedAppendIsRolledBack(self) -> None:
+        self.savePages(1, 3)
+        self.packer().pack()
+        before = self.read(self.ARCHIVE)
+
+        self.savePages(4, 6)
+        with self.assertRaises(KeyboardInterrupt):
+            self.packer(InterruptedPacker).pack()
+
+        self.assertEqual(self.read(self.ARCHIVE), before)
+        self.assertFalse(os.path.exists(os.path.join(self.directory, f".{self.ARCHIVE}.journal")))
+        self.assertIsNone(self.state.getPacked("https://example.com/4", 0))
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "00004.png")))
+
+        self.assertEqual(self.packer().pack(), 3)
+        self.assertEqual(self.members(), [f"{n:05d}.png" for n in range(1, 7)])
+
+    def testJournalLeftByACrashIsRolledBack(self) -> None:
+        self.savePages(1, 3)
+        self.packer().pack()
+        path = os.path.join(self.directory, self.ARCHIVE)
+        before = self.read(self.ARCHIVE)
+
+        # The process died after the journal was written and part of a member went over the central directory
+        packer = self.packer()
+        with zipfile.ZipFile(path) as cbz:
+            packer._saveJournal(path, os.path.join(self.directory, f".{self.ARCHIVE}.journal"), cbz.start_dir)
+            start = cbz.start_dir
+        with open(path, 'r+b') as file:
+            file.seek(start)
+            file.write(b"\0" * 64)
+        with self.assertRaises(zipfile.BadZipFile):
+            zipfile.ZipFile(path).close()
+
+        self.savePages(4, 4)
+        self.assertEqual(packer.pack(), 1)
+        self.assertEqual(self.members(), [f"{n:05d}.png" for n in range(1, 5)])
+        self.assertEqual(self.read(self.ARCHIVE)[:start], before[:start])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import time
+import threading
+import unittest
+
+from pipeline import DownloadJob, DownloadPipeline
+
+def job(n: int) -> DownloadJob:
+    return DownloadJob("Comic", f"https://example.com/{n}", 0, f"https://example.com/{n}.png", "comics/Comic", f"{n:05d}", None, None)
+
+class DownloadPipelineTest(unittest.TestCase):
+    """Checkpoint ordering and failure handling, with handlers the test controls."""
+
+    def testCheckpointsWaitForEarlierJobs(self) -> None:
+        # Job 0 is held until the end, so jobs submitted after it finish first
+        release = threading.Event()
+        finished: list[int] = []
+        def handler(job: DownloadJob) -> None:
+            if job.filename == "00000":
+                release.wait(5)
+            finished.append(int(job.filename))
+
+        checkpoints: list[str] = []
+        pipeline = DownloadPipeline(handler, workers=3, onCheckpoint=checkpoints.append)
+        pipeline.submit(job(0))
+        pipeline.checkpoint("page 1")
+        pipeline.submit(job(1))
+        pipeline.submit(job(2))
+        pipeline.checkpoint("page 2")
+        pipeline.checkpoint("page 3")
+
+        while len(finished) < 2:
+            time.sleep(0.01)
+        self.assertEqual(checkpoints, [])
+
+        release.set()
+        pipeline.close()
+        self.assertEqual(sorted(finished), [0, 1, 2])
+        self.assertEqual(checkpoints, ["page 1", "page 2", "page 3"])
+
+    def testCheckpointWithNothingPendingFiresAtOnce(self) -> None:
+        checkpoints: list[int] = []
+        with DownloadPipeline(lambda job: None, workers=1, onCheckpoint=checkpoints.append) as pipeline:
+            pipeline.checkpoint(1)
+            self.assertEqual(checkpoints, [1])
+
+    def testFailureStopsThePipeline(self) -> None:
+        error = OSError("disk full")
+        handled: list[int] = []
+        def handler(job: DownloadJob) -> None:
+            handled.append(int(job.filename))
+            if job.filename == "00001":
+                raise error
+
+        checkpoints: list[int] = []
+        pipeline = DownloadPipeline(handler, workers=1, onCheckpoint=checkpoints.append)
+        pipeline.submit(job(0))
+        pipeline.checkpoint(1)
+        pipeline.submit(job(1))
+        pipeline.checkpoint(2)
+
+        # The failure reaches the walker on its next submit
+        with self.assertRaises(OSError) as raised:
+            for n in range(2, 100):
+                pipeline.submit(job(n))
+                time.sleep(0.01)
+        self.assertIs(raised.exception, error)
+
+        with self.assertRaises(OSError):
+            pipeline.close()
+        self.assertEqual(checkpoints, [1])
+        self.assertEqual(handled[:2], [0, 1])
+        self.assertLess(len(handled), 98)
+
+    def testAbortDiscardsQueuedJobs(self) -> None:
+        started, release = threading.Event(), threading.Event()
+        handled: list[int] = []
+        def handler(job: DownloadJob) -> None:
+            started.set()
+            release.wait(5)
+            handled.append(int(job.filename))
+
+        checkpoints: list[int] = []
+        pipeline = DownloadPipeline(handler, workers=1, queueSize=8, onCheckpoint=checkpoints.append)
+        for n in range(5):
+            pipeline.submit(job(n))
+        pipeline.checkpoint(5)
+        started.wait(5)
+
+        # abort() waits for the running job; by the time it is let go the rest are discarded
+        aborting = threading.Thread(target=pipeline.abort)
+        aborting.start()
+        time.sleep(0.1)
+        release.set()
+        aborting.join()
+        self.assertEqual(handled, [0])
+        self.assertEqual(checkpoints, [])
+        with self.assertRaises(RuntimeError):
+            pipeline.raiseIfFailed()
+
+if __name__ == "__main__":
+    unittest.main()
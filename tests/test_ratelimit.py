@@ -0,0 +1,65 @@
+import unittest
+
+import requests
+
+from downloader import StalePageError
+from ratelimit import RateLimiter
+
+def httpError(status: int, retryAfter: str | None = None) -> requests.HTTPError:
+    response = requests.Response()
+    response.status_code = status
+    if retryAfter is not None:
+        response.headers["Retry-After"] = retryAfter
+    return requests.HTTPError(f"{status} error", response=response)
+
+class RateLimiterTest(unittest.TestCase):
+    """Which failures RateLimiter.call retries, with the waits taken out."""
+
+    URL = "https://example.com/page"
+
+    def setUp(self) -> None:
+        self.limiter = RateLimiter(initialRate=1000.0, maxRate=1000.0, maxAttempts=3, backoff=0.0)
+        self.retried: list[int] = []
+
+    def call(self, error: BaseException) -> int:
+        """Raise `error` on every attempt; returns how many attempts were made."""
+        attempts = 0
+        def fail() -> None:
+            nonlocal attempts
+            attempts += 1
+            raise error
+        with self.assertRaises(type(error)):
+            self.limiter.call(self.URL, fail, onRetry=lambda error, attempt: self.retried.append(attempt))
+        return attempts
+
+    def testTransientErrorsAreRetried(self) -> None:
+        for error in (requests.ConnectionError("refused"), requests.Timeout("slow"),
+            requests.exceptions.ChunkedEncodingError("cut off"), StalePageError("stale"), httpError(502)):
+            with self.subTest(error=type(error).__name__):
+                self.retried.clear()
+                self.assertEqual(self.call(error), 3)
+                self.assertEqual(self.retried, [1, 2])
+
+    def testOtherErrorsAreRaisedAtOnce(self) -> None:
+        for error in (httpError(404), httpError(403), KeyError("image"), ValueError("bad url"), OSError("disk full")):
+            with self.subTest(error=repr(error)):
+                self.retried.clear()
+                self.assertEqual(self.call(error), 1)
+                self.assertEqual(self.retried, [])
+
+    def testThrottlingSlowsTheHost(self) -> None:
+        self.limiter = RateLimiter(initialRate=1000.0, minRate=1.0, maxRate=1000.0, maxAttempts=2, backoff=0.0)
+        self.assertEqual(self.call(httpError(503, "0")), 2)
+        self.assertEqual(self.limiter._bucket("example.com").rate, 250.0)
+
+    def testSuccessAfterRetry(self) -> None:
+        results = iter([requests.ConnectionError("reset"), "page"])
+        def flaky() -> str:
+            result = next(results)
+            if isinstance(result, Exception):
+                raise result
+            return result
+        self.assertEqual(self.limiter.call(self.URL, flaky), "page")
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+import os
+import time
+import shutil
+import tempfile
+import unittest
+
+from pipeline import DownloadJob
+from workqueue import QueuePipeline, WorkQueue, imageKey
+
+class WorkQueueTest(unittest.TestCase):
+    """Leases, reclaiming and result collection against a temporary queue file."""
+
+    LEASE = 0.05
+
+    def setUp(self) -> None:
+        self.directory = tempfile.mkdtemp(prefix="workqueue-test-")
+        self.path = os.path.join(self.directory, "queue.sqlite")
+        self.queues: list[WorkQueue] = []
+
+    def tearDown(self) -> None:
+        for queue in self.queues:
+            queue.close()
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def worker(self, workerId: str, leaseSeconds: float = LEASE, maxAttempts: int = 3) -> WorkQueue:
+        # One WorkQueue per worker, all on the same file, as separate processes would have
+        queue = WorkQueue(self.path, workerId=workerId, leaseSeconds=leaseSeconds, maxAttempts=maxAttempts)
+        self.queues.append(queue)
+        return queue
+
+    def expire(self) -> None:
+        time.sleep(self.LEASE * 2)
+
+    def testLeaseIsExclusive(self) -> None:
+        first, second = self.worker("w1"), self.worker("w2")
+        first.enqueue("comic", "Comic", {"comic": {}})
+
+        task = first.lease(["comic"])
+        self.assertIsNotNone(task)
+        self.assertEqual(task.attempts, 1)
+        self.assertIsNone(second.lease(["comic"]))
+        self.assertFalse(second.idle())
+
+    def testEnqueueLeavesLeasedTasksAlone(self) -> None:
+        queue = self.worker("w1", leaseSeconds=60)
+        queue.enqueue("comic", "Comic", {"n": 1})
+        task = queue.lease(["comic"])
+
+        queue.enqueue("comic", "Comic", {"n": 2})
+        self.assertIsNone(queue.lease(["comic"]))
+
+        queue.complete(task, {"new_pages": 3})
+        queue.enqueue("comic", "Comic", {"n": 3})
+        again = queue.lease(["comic"])
+        self.assertEqual(again.payload, {"n": 3})
+        self.assertEqual(again.attempts, 1)
+
+    def testExpiredLeaseIsReclaimed(self) -> None:
+        crashed, survivor = self.worker("w1"), self.worker("w2")
+        crashed.enqueue("comic", "Comic", {})
+        task = crashed.lease(["comic"])
+
+        self.expire()
+        taken = survivor.lease(["comic"])
+        self.assertEqual(taken.id, task.id)
+        self.assertEqual(taken.attempts, 2)
+
+        # The first worker learns it lost the task, and its late result is ignored
+        self.assertEqual(crashed.heartbeat(), {task.id})
+        crashed.complete(task, {"new_pages": 1})
+        self.assertEqual(survivor.comics(), [("Comic", "leased", None, None)])
+
+        survivor.complete(taken, {"new_pages": 2})
+        self.assertEqual(survivor.comics(), [("Comic", "done", {"new_pages": 2}, None)])
+        self.assertTrue(survivor.idle())
+
+    def testHeartbeatKeepsLease(self) -> None:
+        holder, other = self.worker("w1", leaseSeconds=0.2), self.worker("w2")
+        holder.enqueue("comic", "Comic", {})
+        holder.lease(["comic"])
+
+        for _ in range(3):
+            time.sleep(0.1)
+            self.assertEqual(holder.heartbeat(), set())
+        self.assertIsNone(other.lease(["comic"]))
+
+    def testHeartbeatRegistersWorker(self) -> None:
+        first, second = self.worker("w1"), self.worker("w2")
+        first.heartbeat()
+        self.assertEqual([worker for worker, _ in second.workers()], ["w1"])
+
+        second.heartbeat()
+        workers = dict(first.workers())
+        self.assertEqual(sorted(workers), ["w1", "w2"])
+        self.assertLess(workers["w2"], 1.0)
+
+    def testFailsAfterMaxAttempts(self) -> None:
+        queue = self.worker("w1", maxAttempts=2)
+        queue.enqueue("comic", "Comic", {})
+
+        self.assertEqual(queue.lease(["comic"]).attempts, 1)
+        self.expire()
+        self.assertEqual(queue.lease(["comic"]).attempts, 2)
+        self.expire()
+        self.assertIsNone(queue.lease(["comic"]))
+        self.assertEqual(queue.comics(), [("Comic", "failed", None, "lease expired too many times")])
+        self.assertTrue(queue.idle())
+
+    def testCollectAdoptsCrashedWalkersResults(self) -> None:
+        walker, downloader = self.worker("walker"), self.worker("downloader")
+        job = DownloadJob("Comic", "https://example.com/1", 0, "https://example.com/1.png", "comics/Comic", "00001 - One", None, None)
+        record = [job.page, job.position, job.url, "00001 - One.png", 10, None, None, None]
+
+        # The walker submits and dies before collecting
+        QueuePipeline(walker, "Comic", lambda job, record: None).submit(job)
+        task = downloader.lease(["image"])
+        self.assertEqual(task.key, imageKey(job))
+        downloader.complete(task, {"record": record})
+
+        # Whoever walks the comic next records the orphaned result
+        results: list[tuple[DownloadJob, list]] = []
+        resumed = QueuePipeline(self.worker("next"), "Comic", lambda job, record: results.append((job, record)))
+        resumed.raiseIfFailed()
+        self.assertEqual(len(results), 1)
+        self.assertEqual(results[0][0].page, job.page)
+        self.assertEqual(results[0][1], record)
+        self.assertEqual(walker.collect("Comic"), [])
+
+    def testFailedImageFailsThePipeline(self) -> None:
+        walker, downloader = self.worker("walker"), self.worker("downloader")
+        checkpoints: list[int] = []
+        pipeline = QueuePipeline(walker, "Comic", lambda job, record: None, onCheckpoint=checkpoints.append)
+        pipeline.submit(DownloadJob("Comic", "https://example.com/1", 0, "https://example.com/1.png", "comics/Comic", "1", None, None))
+        pipeline.checkpoint(1)
+
+        downloader.fail(downloader.lease(["image"]), "404")
+        with self.assertRaises(RuntimeError):
+            pipeline.close()
+        self.assertEqual(checkpoints, [])
+
+if __name__ == "__main__":
+    unittest.main()
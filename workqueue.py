@@ -0,0 +1,358 @@
+import os
+import json
+import time
+import socket
+import sqlite3
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Optional
+
+from pipeline import DownloadJob
+
+class Task(NamedTuple):
+    id: int
+    kind: str # comic or image
+    key: str
+    parent: Optional[str] # the comic an image belongs to
+    payload: dict[str, Any]
+    attempts: int
+
+class WorkQueue:
+    """Comic and image tasks shared by a coordinator and any number of workers, in one SQLite file.
+
+    A worker leases a task for `leaseSeconds` and keeps it alive with
+    heartbeat(). Leases that run out (the worker crashed or lost the
+    filesystem) are handed back to the queue, up to `maxAttempts` times. Keys
+    are unique, so a comic is only ever leased by one worker at a time.
+
+    Every worker needs to see the same file and the same comics directory;
+    SQLite locking has to work on that filesystem (local disks do, many
+    network filesystems do not).
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            key TEXT NOT NULL UNIQUE,
+            parent TEXT,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL,
+            owner TEXT,
+            lease_expires REAL,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            result TEXT,
+            error TEXT,
+            updated_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS tasks_status ON tasks (status, kind);
+        CREATE INDEX IF NOT EXISTS tasks_parent ON tasks (parent, status);
+        CREATE TABLE IF NOT EXISTS workers (
+            id TEXT PRIMARY KEY,
+            heartbeat REAL NOT NULL,
+            started REAL NOT NULL
+        );
+    """
+
+    def __init__(self, path: str, workerId: Optional[str] = None, leaseSeconds: float = 60.0, maxAttempts: int = 3) -> None:
+        self.path = path
+        self.workerId = workerId or f"{socket.gethostname()}-{os.getpid()}"
+        self.leaseSeconds = leaseSeconds
+        self.maxAttempts = max(1, maxAttempts)
+        self._lock = threading.RLock()
+        self._held: set[int] = set()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Autocommit; writes that must be atomic use _transaction()
+        self._connection: Optional[sqlite3.Connection] = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.executescript(self.SCHEMA)
+
+    def __enter__(self) -> 'WorkQueue':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        self.close()
+        # Do not suppress exceptions
+        return False
+
+    def close(self) -> None:
+        """Close the database. Safe to call more than once."""
+        with self._lock:
+            if self._connection is None:
+                return
+            self._connection.close()
+            self._connection = None
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._lock:
+            # Take the write lock up front so two workers cannot lease the same task
+            self._connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._connection
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+            self._connection.execute("COMMIT")
+
+    def enqueue(self, kind: str, key: str, payload: dict[str, Any], parent: Optional[str] = None) -> None:
+        """Add a task. A finished task with the same key is queued again; a pending or leased one is left alone."""
+        with self._transaction() as connection:
+            connection.execute("""
+                INSERT INTO tasks (kind, key, parent, payload, status, updated_at) VALUES (?, ?, ?, ?, 'pending', ?)
+                ON CONFLICT (key) DO UPDATE SET
+                    payload = excluded.payload, status = 'pending', owner = NULL, lease_expires = NULL,
+                    attempts = 0, result = NULL, error = NULL, updated_at = excluded.updated_at
+                WHERE tasks.status IN ('done', 'failed')
+            """, (kind, key, parent, json.dumps(payload), time.time()))
+
+    def lease(self, kinds: Iterable[str]) -> Optional[Task]:
+        """Take the oldest pending task of one of `kinds`, or None when there is none."""
+        kinds = tuple(kinds)
+        now = time.time()
+        with self._transaction() as connection:
+            self._reclaim(connection, now)
+            row = connection.execute(
+                f"SELECT id, kind, key, parent, payload, attempts FROM tasks WHERE status = 'pending' AND kind IN ({','.join('?' * len(kinds))}) ORDER BY id LIMIT 1",
+                kinds
+            ).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                "UPDATE tasks SET status = 'leased', owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                (self.workerId, now + self.leaseSeconds, now, row[0])
+            )
+            self._held.add(row[0])
+        return Task(row[0], row[1], row[2], row[3], json.loads(row[4]), row[5] + 1)
+
+    def reclaim(self) -> None:
+        """Hand expired leases back to the queue."""
+        with self._transaction() as connection:
+            self._reclaim(connection, time.time())
+
+    def _reclaim(self, connection: sqlite3.Connection, now: float) -> None:
+        connection.execute(
+            "UPDATE tasks SET status = 'failed', owner = NULL, error = 'lease expired too many times', updated_at = ? WHERE status = 'leased' AND lease_expires < ? AND attempts >= ?",
+            (now, now, self.maxAttempts)
+        )
+        connection.execute(
+            "UPDATE tasks SET status = 'pending', owner = NULL, lease_expires = NULL, updated_at = ? WHERE status = 'leased' AND lease_expires < ?",
+            (now, now)
+        )
+
+    def heartbeat(self) -> set[int]:
+        """Extend every lease this worker holds. Returns the ids of tasks it no longer owns."""
+        now = time.time()
+        with self._transaction() as connection:
+            connection.execute(
+                "INSERT INTO workers (id, heartbeat, started) VALUES (?, ?, ?) ON CONFLICT (id) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.workerId, now, now)
+            )
+            connection.execute(
+                "UPDATE tasks SET lease_expires = ? WHERE status = 'leased' AND owner = ?",
+                (now + self.leaseSeconds, self.workerId)
+            )
+            owned = {row[0] for row in connection.execute("SELECT id FROM tasks WHERE status = 'leased' AND owner = ?", (self.workerId,))}
+            lost = self._held - owned
+            self._held -= lost
+        return lost
+
+    def complete(self, task: Task, result: Optional[dict[str, Any]] = None) -> None:
+        self._finish(task, 'done', json.dumps(result) if result is not None else None, None)
+
+    def fail(self, task: Task, error: str) -> None:
+        self._finish(task, 'failed', None, error)
+
+    def _finish(self, task: Task, status: str, result: Optional[str], error: Optional[str]) -> None:
+        with self._transaction() as connection:
+            # A lease that was reclaimed in the meantime belongs to someone else now
+            connection.execute(
+                "UPDATE tasks SET status = ?, owner = NULL, lease_expires = NULL, result = ?, error = ?, updated_at = ? WHERE id = ? AND owner = ?",
+                (status, result, error, time.time(), task.id, self.workerId)
+            )
+            self._held.discard(task.id)
+
+    def collect(self, parent: str) -> list[tuple[str, str, Optional[dict[str, Any]], Optional[str]]]:
+        """Remove and return the finished image tasks of `parent` as (key, status, result, error)."""
+        with self._transaction() as connection:
+            rows = connection.execute(
+                "SELECT id, key, status, result, error FROM tasks WHERE kind = 'image' AND parent = ? AND status IN ('done', 'failed')",
+                (parent,)
+            ).fetchall()
+            connection.executemany("DELETE FROM tasks WHERE id = ?", [(row[0],) for row in rows])
+        return [(key, status, json.loads(result) if result else None, error) for _, key, status, result, error in rows]
+
+    def cancel(self, parent: str) -> None:
+        """Drop the image tasks of `parent` nobody has started yet."""
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM tasks WHERE kind = 'image' AND parent = ? AND status = 'pending'", (parent,))
+
+    def idle(self) -> bool:
+        """True when nothing is pending or leased, so workers can stop."""
+        with self._lock:
+            return self._connection.execute("SELECT 1 FROM tasks WHERE status IN ('pending', 'leased') LIMIT 1").fetchone() is None
+
+    def status(self) -> dict[str, dict[str, int]]:
+        """Task counts by kind and status."""
+        with self._lock:
+            counts: dict[str, dict[str, int]] = {}
+            for kind, status, count in self._connection.execute("SELECT kind, status, COUNT(*) FROM tasks GROUP BY kind, status"):
+                counts.setdefault(kind, {})[status] = count
+            return counts
+
+    def workers(self) -> list[tuple[str, float]]:
+        """(worker id, seconds since its last heartbeat) for every worker seen."""
+        with self._lock:
+            now = time.time()
+            return [(worker, now - heartbeat) for worker, heartbeat in self._connection.execute("SELECT id, heartbeat FROM workers ORDER BY id")]
+
+    def comics(self) -> list[tuple[str, str, Optional[dict[str, Any]], Optional[str]]]:
+        """(name, status, result, error) of every comic task."""
+        with self._lock:
+            return [
+                (key, status, json.loads(result) if result else None, error)
+                for key, status, result, error in self._connection.execute("SELECT key, status, result, error FROM tasks WHERE kind = 'comic' ORDER BY id")
+            ]
+
+class RecordedImage:
+    """Stands in for CrawlState on a worker that saves another worker's image.
+
+    Nothing is known about the image up front; whatever saveImage records is
+    kept and sent back to the comic's walker, the only writer of its state.
+    """
+
+    def __init__(self) -> None:
+        self.record: Optional[list[Any]] = None
+
+    def getImage(self, pageURL: str, position: int) -> Optional[dict[str, Any]]:
+        return None
+
+    def recordImage(self,
+        pageURL: str,
+        position: int,
+        url: str,
+        filename: str,
+        size: Optional[int] = None,
+        sha256: Optional[str] = None,
+        etag: Optional[str] = None,
+        lastModified: Optional[str] = None,
+        ) -> None:
+        self.record = [pageURL, position, url, filename, size, sha256, etag, lastModified]
+
+def imageKey(job: DownloadJob) -> str:
+    return json.dumps([job.comicName, job.page, job.position])
+
+class QueuePipeline:
+    """DownloadPipeline counterpart that lets any worker download a comic's images.
+
+    Jobs go into the WorkQueue instead of a local queue; at most `queueSize`
+    are outstanding at once. Finished jobs are collected by the walker (the
+    worker holding the comic's lease), which passes each result to
+    `onResult(job, record)` and fires checkpoints in order like DownloadPipeline.
+    Like DownloadPipeline, several threads may submit at once.
+    """
+
+    POLL_INTERVAL = 0.25
+
+    def __init__(self,
+        queue: WorkQueue,
+        comicName: str,
+        onResult: Callable[[DownloadJob, Optional[list[Any]]], None],
+        queueSize: int = 16,
+        onCheckpoint: Optional[Callable[[Any], None]] = None,
+        skip: Optional[Callable[[DownloadJob], bool]] = None,
+        ) -> None:
+        self._queue = queue
+        self._comicName = comicName
+        self._onResult = onResult
+        self._onCheckpoint = onCheckpoint
+        self._skip = skip
+        self._queueSize = max(1, queueSize)
+        self._submitted: int = 0
+        self._pending: dict[str, tuple[int, DownloadJob]] = {}
+        self._checkpoints: deque[tuple[int, Any]] = deque()
+        self._error: Optional[BaseException] = None
+        # Archive backfills submit from several threads while the walker collects
+        self._lock = threading.RLock()
+
+    def __enter__(self) -> 'QueuePipeline':
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> bool:
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        # Do not suppress exceptions
+        return False
+
+    def raiseIfFailed(self) -> None:
+        with self._lock:
+            self._collect()
+            error = self._error
+        if error is not None:
+            raise error
+
+    def submit(self, job: DownloadJob) -> None:
+        self.raiseIfFailed()
+        if self._skip is not None and self._skip(job):
+            return
+        while True:
+            with self._lock:
+                if len(self._pending) < self._queueSize:
+                    self._submitted += 1
+                    key = imageKey(job)
+                    self._pending[key] = (self._submitted, job)
+                    self._queue.enqueue("image", key, job._asdict(), parent=self._comicName)
+                    return
+            time.sleep(self.POLL_INTERVAL)
+            self.raiseIfFailed()
+
+    def checkpoint(self, value: Any) -> None:
+        with self._lock:
+            self._checkpoints.append((self._submitted, value))
+            self._fireCheckpoints()
+
+    def close(self) -> None:
+        """Wait for every submitted job, fire the remaining checkpoints and raise the first error."""
+        while True:
+            with self._lock:
+                self._collect()
+                if not self._pending or self._error is not None:
+                    break
+            time.sleep(self.POLL_INTERVAL)
+        self.raiseIfFailed()
+
+    def abort(self) -> None:
+        """Withdraw the jobs nobody has started; those already running finish on their own."""
+        with self._lock:
+            self._queue.cancel(self._comicName)
+            self._pending.clear()
+            self._checkpoints.clear()
+
+    def _collect(self) -> None:
+        # Callers hold self._lock
+        for key, status, result, error in self._queue.collect(self._comicName):
+            submitted = self._pending.pop(key, None)
+            if status == "failed":
+                if self._error is None:
+                    self._error = RuntimeError(error or "download failed")
+                continue
+            record = result.get("record") if result else None
+            if submitted is not None:
+                self._onResult(submitted[1], record)
+            elif record:
+                # Left over from a walker that crashed before collecting it
+                self._onResult(DownloadJob(self._comicName, record[0], record[1], record[2], "", "", None, None), record)
+        self._fireCheckpoints()
+
+    def _fireCheckpoints(self) -> None:
+        if self._onCheckpoint is None or self._error is not None:
+            return
+        oldest = min((sequence for sequence, _ in self._pending.values()), default=None)
+        while self._checkpoints and (oldest is None or self._checkpoints[0][0] < oldest):
+            self._onCheckpoint(self._checkpoints.popleft()[1])